@@ -5,7 +5,7 @@ Fixed Mega Dataset Merger
 
 Fixes the issues with the previous merger:
 1. Properly includes Rinabuoy data in splits
-2. More space-efficient (symbolic links instead of copying)
+2. More space-efficient (hard/symbolic links instead of copying)
 3. Accurate duration calculations
 
 Expected result: 160+ hours total!
@@ -13,17 +13,39 @@ Expected result: 160+ hours total!
 
 import pandas as pd
 import json
+import orjson
 import os
-import librosa
+import pyarrow as pa
+import pyarrow.parquet as pq
+import queue
+import shutil
+import threading
+import soundfile as sf
 from pathlib import Path
 from datasets import load_dataset
+from tqdm import tqdm
 import logging
-from typing import Dict, List
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
 import numpy as np
+import xxhash
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Column types of the manifest rows this script produces; columns carried over
+# from the original manifests that are not listed here keep their inferred type
+MANIFEST_SCHEMA = pa.schema([
+    ('audio_filepath', pa.string()),
+    ('text', pa.string()),
+    ('duration', pa.float64()),
+    ('language', pa.string()),
+    ('speaker', pa.string()),
+    ('session_id', pa.string()),
+    ('source', pa.string()),
+])
+
 class FixedMegaMerger:
     """Fixed merger for all three datasets"""
     
@@ -34,6 +56,12 @@ class FixedMegaMerger:
         
         # Create output directory
         self.fixed_mega_dir.mkdir(exist_ok=True)
+        
+        # Durations probed on earlier runs, keyed by path, mtime and size
+        self.duration_cache_file = self.fixed_mega_dir / ".lsr42_durations.json"
+        
+        # Per-split sample counts and durations, filled once by create_fixed_splits
+        self.split_stats: Dict[str, Dict] = {}
     
     def analyze_original_dataset(self) -> Dict[str, List[Dict]]:
         """Analyze original dataset to get accurate statistics"""
@@ -49,12 +77,20 @@ class FixedMegaMerger:
                 split_data = []
                 split_duration = 0
                 
-                with open(manifest_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        item = json.loads(line)
-                        item['source'] = 'original'
-                        split_data.append(item)
-                        split_duration += item.get('duration', 0)
+                # Parse the JSONL in C, a chunk at a time
+                reader = pd.read_json(
+                    manifest_file,
+                    lines=True,
+                    chunksize=50_000,
+                    dtype=False,
+                    convert_dates=False
+                )
+                with reader:
+                    for chunk in reader:
+                        chunk['source'] = 'original'
+                        if 'duration' in chunk:
+                            split_duration += float(chunk['duration'].sum())
+                        split_data.extend(chunk.to_dict(orient='records'))
                 
                 original_data[split] = split_data
                 total_duration += split_duration
@@ -63,18 +99,51 @@ class FixedMegaMerger:
         logger.info(f"📊 Original total: {total_duration/3600:.2f} hours")
         return original_data
     
+    @staticmethod
+    def _rinabuoy_writer(write_queue: queue.Queue):
+        """Consume (path, pcm, sampling_rate) items until a None sentinel arrives"""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            target_audio, pcm, sampling_rate = item
+            try:
+                sf.write(target_audio, pcm, sampling_rate, subtype='PCM_16')
+            except Exception as e:
+                logger.warning(f"Error writing Rinabuoy audio {target_audio}: {e}")
+    
     def load_and_process_rinabuoy(self) -> List[Dict]:
-        """Load Rinabuoy dataset and create manifest entries"""
-        logger.info("Loading Rinabuoy dataset...")
+        """Stream Rinabuoy dataset, writing audio straight into its target split"""
+        logger.info("Streaming Rinabuoy dataset...")
         
-        # Load from HuggingFace
-        ds = load_dataset("rinabuoy/khm-asr-open")
+        # Stream from HuggingFace so only one decoded sample is alive at a time
+        ds = load_dataset("rinabuoy/khm-asr-open", streaming=True)
+        
+        for split in ['train', 'validation', 'test']:
+            (self.fixed_mega_dir / split / "audio").mkdir(parents=True, exist_ok=True)
         
         rinabuoy_data = []
-        total_duration = 0
         
+        # Decode on this thread, write on another; the bounded queue caps how
+        # many quantized clips can be waiting for the disk at once
+        write_queue = queue.Queue(maxsize=64)
+        writer = threading.Thread(target=self._rinabuoy_writer, args=(write_queue,), daemon=True)
+        writer.start()
+        
+        try:
+            self._stream_rinabuoy(ds, write_queue, rinabuoy_data)
+        finally:
+            write_queue.put(None)
+            writer.join()
+        
+        total_duration = sum(item['duration'] for item in rinabuoy_data)
+        logger.info(f"📊 Rinabuoy total: {len(rinabuoy_data):,} samples, {total_duration/3600:.2f} hours")
+        return rinabuoy_data
+    
+    def _stream_rinabuoy(self, ds, write_queue: queue.Queue, rinabuoy_data: List[Dict]):
+        """Walk the streamed splits, queueing audio writes and collecting metadata"""
         for split_name, split_data in ds.items():
-            logger.info(f"Processing Rinabuoy {split_name}: {len(split_data)} samples")
+            logger.info(f"Processing Rinabuoy {split_name}...")
             
             for idx, sample in enumerate(split_data):
                 try:
@@ -84,38 +153,70 @@ class FixedMegaMerger:
                     if not transcription or not transcription.strip():
                         continue
                     
+                    # Decide the split up front: the original test pool is
+                    # divided evenly between validation and test
+                    if split_name == 'train':
+                        assigned_split = 'train'
+                    else:
+                        assigned_split = 'validation' if idx % 2 == 0 else 'test'
+                    
+                    audio_id = f"rinabuoy_{split_name}_{idx:06d}"
+                    target_audio = self.fixed_mega_dir / assigned_split / "audio" / f"{audio_id}.wav"
+                    
+                    if not target_audio.exists():
+                        # Quantize to 16-bit PCM once, in a single vectorized pass
+                        samples = np.asarray(audio_data['array'], dtype=np.float32)
+                        pcm = np.clip(samples * 32767.0, -32768, 32767).astype(np.int16)
+                        write_queue.put((str(target_audio), pcm, audio_data['sampling_rate']))
+                    
                     # Calculate duration
                     duration = len(audio_data['array']) / audio_data['sampling_rate']
-                    total_duration += duration
                     
-                    # Create manifest entry (no audio saving yet)
                     rinabuoy_data.append({
-                        'audio_id': f"rinabuoy_{split_name}_{idx:06d}",
+                        'audio_id': audio_id,
                         'transcription': transcription.strip(),
                         'duration': duration,
                         'speaker': f'rinabuoy_{split_name}',
                         'source': 'rinabuoy',
                         'language': 'km',
                         'original_split': split_name,
-                        'hf_index': idx,  # Keep track for later audio extraction
-                        'audio_data': audio_data  # Keep audio data for later
+                        'assigned_split': assigned_split,
+                        'hf_index': idx
                     })
                     
                 except Exception as e:
                     logger.warning(f"Error processing Rinabuoy sample {idx}: {e}")
                     continue
-        
-        logger.info(f"📊 Rinabuoy total: {len(rinabuoy_data):,} samples, {total_duration/3600:.2f} hours")
-        return rinabuoy_data
+    
+    @staticmethod
+    def _probe_duration(audio_path: str) -> float:
+        """Read duration from the WAV header without decoding the audio"""
+        try:
+            info = sf.info(audio_path)
+            return info.frames / info.samplerate
+        except (RuntimeError, sf.SoundFileError):
+            return 0.0
     
     def load_lsr42_data(self) -> List[Dict]:
         """Load LSR42 dataset"""
         logger.info("Loading LSR42 dataset...")
         
         tsv_file = self.lsr42_dataset_dir / "line_index.tsv"
-        lsr42_data = []
-        total_duration = 0
         
+        # One directory listing instead of an exists() stat per TSV row
+        wav_files = {
+            entry.name[:-4]: entry
+            for entry in os.scandir(self.lsr42_dataset_dir / "wavs")
+            if entry.name.endswith('.wav')
+        }
+        
+        duration_cache = {}
+        if self.duration_cache_file.exists():
+            with open(self.duration_cache_file, 'r', encoding='utf-8') as f:
+                duration_cache = json.load(f)
+        
+        # Parse the index first so the header reads below can run concurrently
+        entries = []
         with open(tsv_file, 'r', encoding='utf-8') as f:
             for line in f:
                 parts = line.strip().split('\t')
@@ -123,28 +224,101 @@ class FixedMegaMerger:
                     audio_id = parts[0]
                     transcription = parts[1]
                     
-                    audio_file = self.lsr42_dataset_dir / "wavs" / f"{audio_id}.wav"
+                    entry = wav_files.get(audio_id)
                     
-                    if audio_file.exists():
-                        try:
-                            duration = librosa.get_duration(path=str(audio_file))
-                            total_duration += duration
-                        except:
-                            duration = 0.0
-                        
-                        lsr42_data.append({
-                            'audio_id': audio_id,
-                            'transcription': transcription,
-                            'audio_path': str(audio_file),
-                            'duration': duration,
-                            'speaker': 'lsr42_male',
-                            'source': 'lsr42',
-                            'language': 'km'
-                        })
+                    if entry is not None:
+                        stat = entry.stat()
+                        cache_key = f"{entry.path}:{stat.st_mtime_ns}:{stat.st_size}"
+                        entries.append((audio_id, transcription, entry.path, cache_key))
+        
+        # Only probe files that are new or changed since the last run
+        to_probe = [(audio_path, cache_key) for _, _, audio_path, cache_key in entries
+                    if cache_key not in duration_cache]
+        
+        # Header reads are latency-bound syscalls, so threads overlap them well
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            probed = list(executor.map(
+                self._probe_duration,
+                [audio_path for audio_path, _ in to_probe]
+            ))
+        
+        for (_, cache_key), duration in zip(to_probe, probed):
+            # Failed probes are left out so they are retried next time
+            if duration > 0:
+                duration_cache[cache_key] = duration
+        
+        if to_probe:
+            with open(self.duration_cache_file, 'w', encoding='utf-8') as f:
+                json.dump(duration_cache, f)
         
+        logger.info(f"LSR42 durations: {len(entries) - len(to_probe):,} cached, {len(to_probe):,} probed")
+        
+        lsr42_data = []
+        durations = []
+        for audio_id, transcription, audio_path, cache_key in entries:
+            duration = duration_cache.get(cache_key, 0.0)
+            durations.append(duration)
+            lsr42_data.append({
+                'audio_id': audio_id,
+                'transcription': transcription,
+                'audio_path': audio_path,
+                'duration': duration,
+                'speaker': 'lsr42_male',
+                'source': 'lsr42',
+                'language': 'km'
+            })
+        
+        total_duration = sum(durations)
         logger.info(f"📊 LSR42 total: {len(lsr42_data):,} samples, {total_duration/3600:.2f} hours")
         return lsr42_data
     
+    @staticmethod
+    def _deduplicate(data: List[Dict]) -> Tuple[List[Dict], Dict[str, int]]:
+        """Remove repeated entries from one split
+        
+        Exact duplicates share (source, audio_filepath). Cross-source duplicates
+        are the same transcription with the same duration (to 0.1s) coming from
+        a different source than the first occurrence.
+        """
+        seen_files = set()
+        first_source = {}
+        unique = []
+        stats = {'exact': 0, 'cross_source': 0}
+        
+        for item in data:
+            source = item.get('source', 'original')
+            file_key = (source, item['audio_filepath'])
+            if file_key in seen_files:
+                stats['exact'] += 1
+                continue
+            
+            content_key = (
+                xxhash.xxh64_intdigest(item.get('text', '').strip().encode('utf-8')),
+                round(item.get('duration', 0), 1)
+            )
+            if first_source.setdefault(content_key, source) != source:
+                stats['cross_source'] += 1
+                continue
+            
+            seen_files.add(file_key)
+            unique.append(item)
+        
+        return unique, stats
+    
+    def _remove_dropped_rinabuoy_audio(self, split: str, data: List[Dict], kept: List[Dict]):
+        """Delete Rinabuoy clips written while streaming whose rows were deduplicated away"""
+        kept_files = {item['audio_filepath'] for item in kept}
+        removed = 0
+        for item in data:
+            if item.get('source') == 'rinabuoy' and item['audio_filepath'] not in kept_files:
+                try:
+                    (self.fixed_mega_dir / split / item['audio_filepath']).unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info(f"Removed {removed:,} duplicate Rinabuoy clips from {split}")
+    
     def create_fixed_splits(self, original_data: Dict, lsr42_data: List[Dict], rinabuoy_data: List[Dict]) -> Dict[str, List[Dict]]:
         """Create properly balanced splits"""
         logger.info("Creating fixed mega splits...")
@@ -170,8 +344,6 @@ class FixedMegaMerger:
                 }
                 
                 # Keep extra info for processing
-                if 'audio_data' in item:
-                    manifest_item['_audio_data'] = item['audio_data']
                 if 'audio_path' in item:
                     manifest_item['_source_path'] = item['audio_path']
                 
@@ -179,7 +351,6 @@ class FixedMegaMerger:
             return manifest_list
         
         lsr42_manifest = to_manifest(lsr42_data, 'lsr42')
-        rinabuoy_manifest = to_manifest(rinabuoy_data, 'rinabuoy')
         
         # Split external datasets properly
         np.random.seed(42)
@@ -194,18 +365,10 @@ class FixedMegaMerger:
         lsr42_val = lsr42_manifest[lsr42_train_size:lsr42_train_size + lsr42_val_size]
         lsr42_test = lsr42_manifest[lsr42_train_size + lsr42_val_size:]
         
-        # Rinabuoy: Use original split info but distribute properly
-        rinabuoy_train_pool = [x for x in rinabuoy_manifest if 'rinabuoy_train' in x['session_id']]
-        rinabuoy_test_pool = [x for x in rinabuoy_manifest if 'rinabuoy_test' in x['session_id']]
-        
-        # Split test pool into val and test
-        np.random.shuffle(rinabuoy_test_pool)
-        rinabuoy_test_size = len(rinabuoy_test_pool)
-        rinabuoy_val_size = int(rinabuoy_test_size * 0.5)
-        
-        rinabuoy_train = rinabuoy_train_pool
-        rinabuoy_val = rinabuoy_test_pool[:rinabuoy_val_size]
-        rinabuoy_test = rinabuoy_test_pool[rinabuoy_val_size:]
+        # Rinabuoy: splits were assigned while streaming (audio is already in place)
+        rinabuoy_train = to_manifest([x for x in rinabuoy_data if x['assigned_split'] == 'train'], 'rinabuoy')
+        rinabuoy_val = to_manifest([x for x in rinabuoy_data if x['assigned_split'] == 'validation'], 'rinabuoy')
+        rinabuoy_test = to_manifest([x for x in rinabuoy_data if x['assigned_split'] == 'test'], 'rinabuoy')
         
         # Create mega splits
         mega_splits = {
@@ -214,16 +377,34 @@ class FixedMegaMerger:
             'test': original_data.get('test', []) + lsr42_test + rinabuoy_test
         }
         
+        # Drop duplicate entries before anything is linked or written
+        dedup_stats = {}
+        for split, data in mega_splits.items():
+            mega_splits[split], dedup_stats[split] = self._deduplicate(data)
+            self._remove_dropped_rinabuoy_audio(split, data, mega_splits[split])
+        
         # Log detailed statistics
         logger.info("\n🎯 FIXED MEGA DATASET SPLITS:")
         total_samples = 0
         total_duration = 0
         
         for split, data in mega_splits.items():
-            original_count = len([x for x in data if x.get('source', 'original') == 'original'])
-            lsr42_count = len([x for x in data if x.get('source') == 'lsr42'])
-            rinabuoy_count = len([x for x in data if x.get('source') == 'rinabuoy'])
-            split_duration = sum(x.get('duration', 0) for x in data) / 3600
+            # Single pass per split; reused by create_manifests_and_info
+            source_counts = Counter()
+            split_duration = 0.0
+            for x in data:
+                source_counts[x.get('source', 'original')] += 1
+                split_duration += x.get('duration', 0)
+            split_duration /= 3600
+            self.split_stats[split] = {
+                'samples': len(data),
+                'duration_hours': split_duration,
+                'source_counts': source_counts
+            }
+            
+            original_count = source_counts['original']
+            lsr42_count = source_counts['lsr42']
+            rinabuoy_count = source_counts['rinabuoy']
             
             total_samples += len(data)
             total_duration += split_duration
@@ -232,64 +413,89 @@ class FixedMegaMerger:
             logger.info(f"  📊 Original: {original_count:,}")
             logger.info(f"  📊 LSR42: {lsr42_count:,}")
             logger.info(f"  📊 Rinabuoy: {rinabuoy_count:,}")
+            logger.info(f"  🧹 Duplicates removed: {dedup_stats[split]['exact']:,} exact, "
+                        f"{dedup_stats[split]['cross_source']:,} cross-source")
         
         logger.info(f"\n📈 TOTAL: {total_samples:,} samples, {total_duration:.2f} hours")
         
         return mega_splits
     
+    @staticmethod
+    def _same_device(path, device: int) -> bool:
+        """Whether path exists and lives on the given filesystem device"""
+        try:
+            return os.stat(path).st_dev == device
+        except OSError:
+            return False
+    
+    @staticmethod
+    def _materialize_audio(op: str, source_audio: str, target_audio: str) -> bool:
+        """Link (or, as a last resort, copy) one audio file into the mega dataset"""
+        if not os.path.exists(source_audio):
+            return False
+        
+        if op == 'hardlink':
+            try:
+                os.link(source_audio, target_audio)
+                return True
+            except OSError:
+                pass
+        
+        try:
+            os.symlink(os.path.realpath(source_audio), target_audio)
+        except OSError:
+            # Fallback to copy if no kind of link is possible
+            shutil.copy2(source_audio, target_audio)
+        return True
+    
     def create_space_efficient_dataset(self, mega_splits: Dict[str, List[Dict]]):
-        """Create dataset with symbolic links to save space"""
+        """Create dataset with hard links (or symbolic links) to save space"""
         logger.info("Creating space-efficient mega dataset...")
         
+        max_workers = min(64, (os.cpu_count() or 1) * 8)
+        lsr42_wavs_dir = self.lsr42_dataset_dir / "wavs"
+        
         for split, data in mega_splits.items():
             split_dir = self.fixed_mega_dir / split
             split_audio_dir = split_dir / "audio"
             split_audio_dir.mkdir(parents=True, exist_ok=True)
             
-            processed_count = 0
+            # Plain strings in the per-item loop; Path objects are built once per split
+            split_audio_dir_str = str(split_audio_dir)
+            original_split_dir_str = str(self.original_dataset_dir / split)
             
+            # Hard links only work within one filesystem; otherwise fall back to symlinks
+            target_dev = os.stat(split_audio_dir_str).st_dev
+            original_op = 'hardlink' if self._same_device(original_split_dir_str, target_dev) else 'symlink'
+            lsr42_op = 'hardlink' if self._same_device(lsr42_wavs_dir, target_dev) else 'symlink'
+            
+            # Collect the file operations first, then run them concurrently
+            tasks = []
             for item in data:
-                audio_filename = Path(item['audio_filepath']).name
-                target_audio = split_audio_dir / audio_filename
+                audio_filepath = item['audio_filepath']
+                audio_filename = audio_filepath.rsplit('/', 1)[-1]
+                target_audio = os.path.join(split_audio_dir_str, audio_filename)
                 
-                if target_audio.exists():
+                if os.path.exists(target_audio):
                     continue
                 
                 source = item.get('source', 'original')
                 
                 if source == 'original':
-                    # Symbolic link to original audio
-                    source_audio = self.original_dataset_dir / split / item['audio_filepath']
-                    if source_audio.exists():
-                        try:
-                            os.symlink(source_audio.resolve(), target_audio)
-                        except:
-                            # Fallback to copy if symlink fails
-                            import shutil
-                            shutil.copy2(source_audio, target_audio)
+                    source_audio = os.path.join(original_split_dir_str, audio_filepath)
+                    tasks.append((original_op, source_audio, target_audio))
                 
                 elif source == 'lsr42':
-                    # Copy LSR42 audio
-                    source_audio = Path(item['_source_path'])
-                    if source_audio.exists():
-                        import shutil
-                        shutil.copy2(source_audio, target_audio)
-                
-                elif source == 'rinabuoy':
-                    # Save Rinabuoy audio from memory
-                    if '_audio_data' in item:
-                        import soundfile as sf
-                        audio_data = item['_audio_data']
-                        sf.write(
-                            str(target_audio),
-                            audio_data['array'],
-                            audio_data['sampling_rate']
-                        )
-                
-                processed_count += 1
-                
-                if processed_count % 1000 == 0:
-                    logger.info(f"  Processed {processed_count} files for {split}...")
+                    tasks.append((lsr42_op, item['_source_path'], target_audio))
+            
+            processed_count = 0
+            
+            # link/copy are syscalls that release the GIL, so threads overlap them
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(self._materialize_audio, *task) for task in tasks]
+                for future in tqdm(as_completed(futures), total=len(futures), desc=f"Linking {split} audio"):
+                    if future.result():
+                        processed_count += 1
             
             logger.info(f"Processed {processed_count} audio files for {split}")
     
@@ -301,8 +507,6 @@ class FixedMegaMerger:
         for split, data in mega_splits.items():
             for item in data:
                 # Remove temporary fields
-                if '_audio_data' in item:
-                    del item['_audio_data']
                 if '_source_path' in item:
                     del item['_source_path']
         
@@ -310,15 +514,13 @@ class FixedMegaMerger:
         for split, data in mega_splits.items():
             split_dir = self.fixed_mega_dir / split
             
-            # PyTorch/ESPnet format
-            with open(split_dir / f"{split}_manifest.jsonl", 'w', encoding='utf-8') as f:
-                for item in data:
-                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            # PyTorch/ESPnet format (serialized in C, written in one call)
+            with open(split_dir / f"{split}_manifest.jsonl", 'wb') as f:
+                f.write(b''.join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in data))
             
             # Hugging Face format
-            hf_data = []
-            for item in data:
-                hf_item = {
+            hf_data = [
+                {
                     'audio': {'path': item['audio_filepath']},
                     'transcription': item['text'],
                     'duration': item['duration'],
@@ -326,30 +528,37 @@ class FixedMegaMerger:
                     'speaker_id': item['speaker'],
                     'source': item['source']
                 }
-                hf_data.append(hf_item)
+                for item in data
+            ]
             
-            with open(split_dir / f"{split}_hf.jsonl", 'w', encoding='utf-8') as f:
-                for item in hf_data:
-                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            with open(split_dir / f"{split}_hf.jsonl", 'wb') as f:
+                f.write(b''.join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in hf_data))
             
-            # CSV format
-            df = pd.DataFrame(data)
-            df.to_csv(split_dir / f"{split}_manifest.csv", index=False, encoding='utf-8')
+            # Canonical columnar manifest; the JSONL files above are kept as thin
+            # shims for train_asr.py and fix_lsr42_transcripts.py
+            # Rows from different sources carry different keys, so the schema
+            # covers the union of them rather than whatever the first row has
+            columns = dict.fromkeys(key for item in data for key in item)
+            schema = pa.schema([
+                MANIFEST_SCHEMA.field(name) if name in MANIFEST_SCHEMA.names
+                else pa.field(name, pa.array([item.get(name) for item in data]).type)
+                for name in columns
+            ])
+            table = pa.Table.from_pylist(data, schema=schema)
+            pq.write_table(table, split_dir / f"{split}_manifest.parquet",
+                           compression='zstd', row_group_size=10_000)
+        
+        # Statistics were accumulated while building the splits
+        sources = ['original', 'lsr42', 'rinabuoy']
+        split_stats = self.split_stats
         
         # Create comprehensive dataset info
-        total_samples = sum(len(data) for data in mega_splits.values())
-        total_duration = sum(
-            sum(item.get('duration', 0) for item in data) 
-            for data in mega_splits.values()
-        ) / 3600
+        total_samples = sum(stats['samples'] for stats in split_stats.values())
+        total_duration = sum(stats['duration_hours'] for stats in split_stats.values())
         
         # Source statistics
-        source_stats = {'original': 0, 'lsr42': 0, 'rinabuoy': 0}
-        for data in mega_splits.values():
-            for item in data:
-                source = item.get('source', 'original')
-                if source in source_stats:
-                    source_stats[source] += 1
+        source_totals = sum((stats['source_counts'] for stats in split_stats.values()), Counter())
+        source_stats = {source: source_totals[source] for source in sources}
         
         dataset_info = {
             "dataset_name": "Fixed Mega Khmer Speech Recognition Dataset",
@@ -357,6 +566,10 @@ class FixedMegaMerger:
             "description": "Comprehensive Khmer ASR dataset with proper Rinabuoy inclusion",
             "audio_format": "wav",
             "sample_rate": 16000,
+            "manifests": {
+                split: f"{split}/{split}_manifest.parquet"
+                for split in mega_splits
+            },
             "statistics": {
                 "total_samples": total_samples,
                 "total_duration_hours": total_duration,
@@ -367,14 +580,14 @@ class FixedMegaMerger:
                 },
                 "splits": {
                     split: {
-                        "samples": len(data),
-                        "duration_hours": sum(item.get('duration', 0) for item in data) / 3600,
+                        "samples": stats['samples'],
+                        "duration_hours": stats['duration_hours'],
                         "source_breakdown": {
-                            source: len([x for x in data if x.get('source', 'original') == source])
-                            for source in ['original', 'lsr42', 'rinabuoy']
+                            source: stats['source_counts'][source]
+                            for source in sources
                         }
                     }
-                    for split, data in mega_splits.items()
+                    for split, stats in split_stats.items()
                 }
             }
         }
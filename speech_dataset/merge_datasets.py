@@ -14,21 +14,40 @@ Combined: ~84,000+ samples with speaker diversity!
 """
 
 import pandas as pd
-import json
+import orjson
+import os
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import shutil
-import librosa
+import soundfile as sf
 from pathlib import Path
 import logging
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Linux ioctl that clones a file's extents (instant copy-on-write on btrfs/XFS)
+FICLONE = 0x40049409
+
+# How audio is placed into the merged dataset, cheapest first
+COPY_MODES = ('hardlink', 'symlink', 'copy')
+
 class DatasetMerger:
     """Merges multiple Khmer speech datasets"""
     
-    def __init__(self):
+    def __init__(self, copy_mode: str = 'hardlink'):
+        if copy_mode not in COPY_MODES:
+            raise ValueError(f"copy_mode must be one of {COPY_MODES}, got {copy_mode!r}")
+        self.copy_mode = copy_mode
         self.original_dataset_dir = Path("dataset")
         self.lsr42_dataset_dir = Path("lsr42_dataset/km_kh_male")
         self.merged_dataset_dir = Path("merged_dataset")
@@ -36,14 +55,24 @@ class DatasetMerger:
         # Create merged dataset directory
         self.merged_dataset_dir.mkdir(exist_ok=True)
     
-    def load_lsr42_data(self) -> List[Dict]:
+    @staticmethod
+    def _probe_duration(audio_path: str) -> float:
+        """Audio duration in seconds from the file header"""
+        try:
+            return sf.info(audio_path).duration
+        except (RuntimeError, sf.SoundFileError):
+            # Unreadable or non-audio file; older soundfile raises RuntimeError
+            return 0.0
+    
+    def load_lsr42_data(self) -> pd.DataFrame:
         """Load and process LSR42 dataset"""
         logger.info("Loading LSR42 dataset...")
         
         # Read transcription file
         tsv_file = self.lsr42_dataset_dir / "line_index.tsv"
-        lsr42_data = []
         
+        # Collect entries first so the header reads can run concurrently
+        entries = []
         with open(tsv_file, 'r', encoding='utf-8') as f:
             for line in f:
                 parts = line.strip().split('\t')
@@ -55,26 +84,27 @@ class DatasetMerger:
                     audio_file = self.lsr42_dataset_dir / "wavs" / f"{audio_id}.wav"
                     
                     if audio_file.exists():
-                        # Get audio duration
-                        try:
-                            duration = librosa.get_duration(filename=str(audio_file))
-                        except:
-                            duration = 0.0
-                        
-                        lsr42_data.append({
-                            'audio_id': audio_id,
-                            'transcription': transcription,
-                            'audio_path': str(audio_file),
-                            'duration': duration,
-                            'speaker': 'lsr42_male',
-                            'source': 'lsr42',
-                            'language': 'km'
-                        })
+                        entries.append((audio_id, transcription, str(audio_file)))
+        
+        # Get audio durations; header reads are I/O bound, so threads overlap them
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            durations = list(executor.map(self._probe_duration, [entry[2] for entry in entries]))
+        
+        audio_ids, transcriptions, audio_paths = (list(column) for column in zip(*entries)) if entries else ([], [], [])
+        lsr42_data = pd.DataFrame({
+            'audio_id': audio_ids,
+            'transcription': transcriptions,
+            'audio_path': audio_paths,
+            'duration': np.asarray(durations, dtype=np.float64),
+            'speaker': 'lsr42_male',
+            'source': 'lsr42',
+            'language': 'km'
+        })
         
         logger.info(f"Loaded {len(lsr42_data)} samples from LSR42")
         return lsr42_data
     
-    def load_original_data(self) -> Dict[str, List[Dict]]:
+    def load_original_data(self) -> Dict[str, pd.DataFrame]:
         """Load original dataset manifests"""
         logger.info("Loading original dataset...")
         
@@ -84,66 +114,93 @@ class DatasetMerger:
             manifest_file = self.original_dataset_dir / split / f"{split}_manifest.jsonl"
             
             if manifest_file.exists():
-                split_data = []
-                with open(manifest_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        item = json.loads(line)
-                        # Add source identifier
-                        item['source'] = 'original'
-                        split_data.append(item)
+                # Parse the whole JSONL in C; keep values exactly as written
+                df = pd.read_json(manifest_file, lines=True, dtype=False, convert_dates=False)
+                # Add source identifier
+                df['source'] = 'original'
                 
-                original_data[split] = split_data
-                logger.info(f"Loaded {len(split_data)} samples from original {split}")
+                original_data[split] = df
+                logger.info(f"Loaded {len(df)} samples from original {split}")
         
         return original_data
     
-    def merge_and_split_data(self, original_data: Dict, lsr42_data: List[Dict]) -> Dict[str, List[Dict]]:
+    @staticmethod
+    def _stats_frame(merged_data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """One row per sample with the columns the statistics are computed from"""
+        frames = [
+            pd.DataFrame({
+                'split': split,
+                'source': df['source'].fillna('unknown') if 'source' in df else 'unknown',
+                'speaker': df['speaker'].fillna('unknown') if 'speaker' in df else 'unknown',
+                'duration': df['duration'].fillna(0) if 'duration' in df else 0
+            }, index=df.index)
+            for split, df in merged_data.items()
+        ]
+        return pd.concat(frames, ignore_index=True)
+    
+    @staticmethod
+    def _concat_split(original: pd.DataFrame, lsr42: pd.DataFrame) -> pd.DataFrame:
+        """Stack one split's original and LSR42 rows into a fresh index"""
+        frames = [df for df in (original, lsr42) if not df.empty]
+        if not frames:
+            # Keep the manifest columns so an empty split still serializes
+            return lsr42.reset_index(drop=True)
+        return pd.concat(frames, ignore_index=True)
+    
+    def merge_and_split_data(self, original_data: Dict[str, pd.DataFrame], lsr42_data: pd.DataFrame) -> Dict[str, pd.DataFrame]:
         """Merge datasets and create new splits"""
         logger.info("Merging datasets and creating new splits...")
         
-        # Convert LSR42 data to manifest format
-        lsr42_manifest = []
-        for item in lsr42_data:
-            lsr42_manifest.append({
-                'audio_filepath': f"audio/{item['audio_id']}.wav",
-                'text': item['transcription'],
-                'duration': item['duration'],
-                'language': 'km',
-                'speaker': 'lsr42_male',
-                'session_id': f"lsr42_{item['audio_id'][:8]}",
-                'source': 'lsr42'
-            })
-        
-        # Combine all data
-        all_train = original_data.get('train', []) + lsr42_manifest
-        all_val = original_data.get('validation', [])
-        all_test = original_data.get('test', [])
-        
-        # Create new splits ensuring LSR42 data is distributed across splits
-        np.random.seed(42)
-        np.random.shuffle(lsr42_manifest)
+        # Convert LSR42 data to manifest format, one column at a time
+        audio_ids = lsr42_data['audio_id'].astype(str)
+        lsr42_manifest = pd.DataFrame({
+            'audio_filepath': 'audio/' + audio_ids + '.wav',
+            'text': lsr42_data['transcription'],
+            'duration': lsr42_data['duration'],
+            'language': 'km',
+            'speaker': 'lsr42_male',
+            'session_id': 'lsr42_' + audio_ids.str[:8],
+            'source': 'lsr42'
+        })
+        
+        # Create new splits ensuring LSR42 data is distributed across splits;
+        # gather through a permutation instead of swapping rows in place
+        rng = np.random.default_rng(42)
+        order = rng.permutation(len(lsr42_manifest))
+        lsr42_manifest = lsr42_manifest.iloc[order].reset_index(drop=True)
         
         # Split LSR42 data: 80% train, 10% val, 10% test
         lsr42_size = len(lsr42_manifest)
         lsr42_train_size = int(lsr42_size * 0.8)
         lsr42_val_size = int(lsr42_size * 0.1)
         
-        lsr42_train = lsr42_manifest[:lsr42_train_size]
-        lsr42_val = lsr42_manifest[lsr42_train_size:lsr42_train_size + lsr42_val_size]
-        lsr42_test = lsr42_manifest[lsr42_train_size + lsr42_val_size:]
+        lsr42_train = lsr42_manifest.iloc[:lsr42_train_size]
+        lsr42_val = lsr42_manifest.iloc[lsr42_train_size:lsr42_train_size + lsr42_val_size]
+        lsr42_test = lsr42_manifest.iloc[lsr42_train_size + lsr42_val_size:]
         
         # Create merged splits
+        empty = pd.DataFrame()
         merged_data = {
-            'train': original_data.get('train', []) + lsr42_train,
-            'validation': original_data.get('validation', []) + lsr42_val,
-            'test': original_data.get('test', []) + lsr42_test
+            'train': self._concat_split(original_data.get('train', empty), lsr42_train),
+            'validation': self._concat_split(original_data.get('validation', empty), lsr42_val),
+            'test': self._concat_split(original_data.get('test', empty), lsr42_test)
         }
         
-        # Log statistics
+        # Log statistics from one vectorized groupby
+        splits = list(merged_data)
+        stats = self._stats_frame(merged_data).groupby(['split', 'source']).agg(
+            count=('duration', 'size'),
+            hours=('duration', 'sum')
+        )
+        counts = stats['count'].unstack(fill_value=0).reindex(
+            index=splits, columns=['original', 'lsr42'], fill_value=0
+        )
+        hours = stats['hours'].groupby(level='split').sum().reindex(splits, fill_value=0.0) / 3600
+        
         for split, data in merged_data.items():
-            original_count = len([x for x in data if x.get('source') == 'original'])
-            lsr42_count = len([x for x in data if x.get('source') == 'lsr42'])
-            total_duration = sum(x.get('duration', 0) for x in data) / 3600
+            original_count = int(counts.at[split, 'original'])
+            lsr42_count = int(counts.at[split, 'lsr42'])
+            total_duration = float(hours[split])
             
             logger.info(f"{split.capitalize()}: {len(data)} total samples")
             logger.info(f"  - Original: {original_count}, LSR42: {lsr42_count}")
@@ -151,31 +208,88 @@ class DatasetMerger:
         
         return merged_data
     
-    def copy_audio_files(self, merged_data: Dict[str, List[Dict]]):
+    @staticmethod
+    def _fast_copy(source_audio: Path, target_audio: Path):
+        """Copy file data in the kernel: reflink, then copy_file_range, then copyfile"""
+        try:
+            with open(source_audio, 'rb') as src, open(target_audio, 'wb') as dst:
+                if fcntl is not None:
+                    try:
+                        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                        return
+                    except OSError:
+                        pass
+                
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                return
+        except (OSError, AttributeError):
+            # EXDEV/ENOSYS, or no copy_file_range on this platform
+            pass
+        
+        shutil.copyfile(source_audio, target_audio)
+    
+    def _place_audio(self, source_audio: Path, target_audio: Path):
+        """Hard-link, then symlink, then copy, starting from the configured mode"""
+        if self.copy_mode == 'hardlink':
+            try:
+                os.link(source_audio, target_audio)
+                return
+            except OSError:
+                # EXDEV across filesystems, or links unsupported
+                pass
+        
+        if self.copy_mode in ('hardlink', 'symlink'):
+            try:
+                os.symlink(os.path.abspath(source_audio), target_audio)
+                return
+            except OSError:
+                pass
+        
+        self._fast_copy(source_audio, target_audio)
+    
+    def copy_audio_files(self, merged_data: Dict[str, pd.DataFrame]):
         """Copy audio files to merged dataset structure"""
-        logger.info("Copying audio files...")
+        logger.info(f"Copying audio files (mode: {self.copy_mode})...")
+        
+        # Place a file only if it doesn't exist yet (metadata is not needed for derived audio)
+        def copy_task(task):
+            source_audio, target_audio = task
+            if source_audio.exists() and not target_audio.exists():
+                self._place_audio(source_audio, target_audio)
+        
+        # Create every target directory up front, outside the worker threads
+        for split in merged_data:
+            (self.merged_dataset_dir / split / "audio").mkdir(parents=True, exist_ok=True)
         
         for split, data in merged_data.items():
             split_audio_dir = self.merged_dataset_dir / split / "audio"
-            split_audio_dir.mkdir(parents=True, exist_ok=True)
             
-            for item in data:
-                if item.get('source') == 'original':
+            tasks = []
+            for source, audio_filepath in zip(data.get('source', []), data.get('audio_filepath', [])):
+                if source == 'original':
                     # Copy from original dataset
-                    source_audio = self.original_dataset_dir / split / item['audio_filepath']
-                    target_audio = split_audio_dir / Path(item['audio_filepath']).name
+                    source_audio = self.original_dataset_dir / split / audio_filepath
+                    target_audio = split_audio_dir / Path(audio_filepath).name
                     
-                elif item.get('source') == 'lsr42':
+                elif source == 'lsr42':
                     # Copy from LSR42 dataset  
-                    audio_filename = Path(item['audio_filepath']).name
+                    audio_filename = Path(audio_filepath).name
                     source_audio = self.lsr42_dataset_dir / "wavs" / audio_filename
                     target_audio = split_audio_dir / audio_filename
                 
-                # Copy file if it doesn't exist
-                if source_audio.exists() and not target_audio.exists():
-                    shutil.copy2(source_audio, target_audio)
+                tasks.append((source_audio, target_audio))
+            
+            # Each copy releases the GIL, so threads keep the disk queue full
+            if tasks:
+                with ThreadPoolExecutor(max_workers=min(32, len(tasks))) as executor:
+                    list(executor.map(copy_task, tasks))
     
-    def create_merged_manifests(self, merged_data: Dict[str, List[Dict]]):
+    def create_merged_manifests(self, merged_data: Dict[str, pd.DataFrame]):
         """Create manifest files for merged dataset"""
         logger.info("Creating merged manifest files...")
         
@@ -183,52 +297,49 @@ class DatasetMerger:
             split_dir = self.merged_dataset_dir / split
             split_dir.mkdir(parents=True, exist_ok=True)
             
-            # PyTorch/ESPnet format
-            with open(split_dir / f"{split}_manifest.jsonl", 'w', encoding='utf-8') as f:
-                for item in data:
-                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            # Canonical columnar manifest; the text formats below are kept
+            # for the training scripts that still read them
+            table = pa.Table.from_pandas(data, preserve_index=False)
+            pq.write_table(table, split_dir / f"{split}_manifest.parquet", compression='zstd')
             
-            # Hugging Face format
-            hf_data = []
-            for item in data:
-                hf_item = {
+            # PyTorch/ESPnet and Hugging Face formats, serialized by orjson in
+            # one pass over the rows; rows only become dicts at this boundary
+            manifest_buf = bytearray()
+            hf_buf = bytearray()
+            for item in data.to_dict(orient='records'):
+                manifest_buf += orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE)
+                hf_buf += orjson.dumps({
                     'audio': {'path': item['audio_filepath']},
                     'transcription': item['text'],
                     'duration': item['duration'],
                     'language': item['language'],
                     'speaker_id': item['speaker']
-                }
-                hf_data.append(hf_item)
+                }, option=orjson.OPT_APPEND_NEWLINE)
             
-            with open(split_dir / f"{split}_hf.jsonl", 'w', encoding='utf-8') as f:
-                for item in hf_data:
-                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            with open(split_dir / f"{split}_manifest.jsonl", 'wb') as f:
+                f.write(manifest_buf)
+            with open(split_dir / f"{split}_hf.jsonl", 'wb') as f:
+                f.write(hf_buf)
             
-            # CSV format
-            df = pd.DataFrame(data)
-            df.to_csv(split_dir / f"{split}_manifest.csv", index=False, encoding='utf-8')
+            # CSV format, encoded in C++ from the same Arrow table
+            pa_csv.write_csv(table, split_dir / f"{split}_manifest.csv")
     
-    def create_merged_dataset_info(self, merged_data: Dict[str, List[Dict]]):
+    def create_merged_dataset_info(self, merged_data: Dict[str, pd.DataFrame]):
         """Create dataset info for merged dataset"""
         logger.info("Creating merged dataset info...")
         
         # Calculate statistics
+        stats = self._stats_frame(merged_data)
+        split_hours = (
+            stats.groupby('split')['duration'].sum() / 3600
+        ).reindex(list(merged_data), fill_value=0.0)
         total_samples = sum(len(data) for data in merged_data.values())
-        total_duration = sum(
-            sum(item.get('duration', 0) for item in data) 
-            for data in merged_data.values()
-        ) / 3600
+        total_duration = float(split_hours.sum())
         
         # Speaker statistics
-        all_speakers = set()
-        source_stats = {'original': 0, 'lsr42': 0}
-        
-        for data in merged_data.values():
-            for item in data:
-                all_speakers.add(item.get('speaker', 'unknown'))
-                source = item.get('source', 'unknown')
-                if source in source_stats:
-                    source_stats[source] += 1
+        unique_speakers = int(stats['speaker'].nunique())
+        source_counts = stats['source'].value_counts()
+        source_stats = {source: int(source_counts.get(source, 0)) for source in ('original', 'lsr42')}
         
         dataset_info = {
             "dataset_name": "Merged Khmer Speech Recognition Dataset",
@@ -236,15 +347,16 @@ class DatasetMerger:
             "description": "Combined Khmer ASR dataset with original + LSR42 data",
             "audio_format": "wav",
             "sample_rate": 16000,
+            "manifests": {split: f"{split}/{split}_manifest.parquet" for split in merged_data},
             "statistics": {
                 "total_samples": total_samples,
                 "total_duration_hours": total_duration,
-                "unique_speakers": len(all_speakers),
+                "unique_speakers": unique_speakers,
                 "source_distribution": source_stats,
                 "splits": {
                     split: {
                         "samples": len(data),
-                        "duration_hours": sum(item.get('duration', 0) for item in data) / 3600
+                        "duration_hours": float(split_hours[split])
                     }
                     for split, data in merged_data.items()
                 }
@@ -252,8 +364,8 @@ class DatasetMerger:
         }
         
         # Save dataset info
-        with open(self.merged_dataset_dir / "dataset_info.json", 'w', encoding='utf-8') as f:
-            json.dump(dataset_info, f, indent=2, ensure_ascii=False)
+        with open(self.merged_dataset_dir / "dataset_info.json", 'wb') as f:
+            f.write(orjson.dumps(dataset_info, option=orjson.OPT_INDENT_2))
         
         # Create README
         readme_content = f"""# Merged Khmer Speech Recognition Dataset
@@ -266,7 +378,7 @@ This is a merged dataset combining:
 ## Statistics
 - **Total Samples**: {total_samples:,}
 - **Total Duration**: {total_duration:.2f} hours
-- **Unique Speakers**: {len(all_speakers)}
+- **Unique Speakers**: {unique_speakers}
 - **Language**: Khmer (km)
 
 ## Data Sources
@@ -319,10 +431,7 @@ python train_asr_model.py --dataset_dir merged_dataset
         
         # Print summary
         total_samples = sum(len(data) for data in merged_data.values())
-        total_duration = sum(
-            sum(item.get('duration', 0) for item in data) 
-            for data in merged_data.values()
-        ) / 3600
+        total_duration = float(self._stats_frame(merged_data)['duration'].sum()) / 3600
         
         print(f"\n🎯 MERGED DATASET SUMMARY:")
         print(f"   📊 Total Samples: {total_samples:,}")
@@ -332,7 +441,15 @@ python train_asr_model.py --dataset_dir merged_dataset
         print(f"\n✅ Ready for training with improved diversity!")
 
 def main():
-    merger = DatasetMerger()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Merge the original and LSR42 Khmer speech datasets')
+    parser.add_argument('--copy-mode', choices=COPY_MODES, default='hardlink',
+                        help='How to place audio files: hardlink (falls back to symlink, then copy), symlink, or copy')
+    
+    args = parser.parse_args()
+    
+    merger = DatasetMerger(copy_mode=args.copy_mode)
     merger.merge_datasets()
 
 if __name__ == "__main__":
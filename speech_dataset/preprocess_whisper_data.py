@@ -11,16 +11,205 @@ import json
 import pandas as pd
 import numpy as np
 import torch
+import torchaudio
 import boto3
 import soundfile as sf
 import io
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from tqdm import tqdm
 from datasets import Dataset, DatasetDict, load_from_disk
-from transformers import WhisperFeatureExtractor, WhisperTokenizer
+from transformers import WhisperFeatureExtractor, WhisperTokenizerFast
 import warnings
 warnings.filterwarnings("ignore")
 
+def batched_log_mel(audio_arrays, feature_extractor, device):
+    """
+    Whisper log-mel features for a whole batch in one STFT call
+    
+    Mirrors WhisperFeatureExtractor (pad/trim to 30s, power STFT, mel
+    projection, log10 with 8 dB dynamic range clamp) but runs batched in
+    torch, so it can execute on the GPU.
+    """
+    n_samples = feature_extractor.n_samples
+    waveforms = torch.zeros(len(audio_arrays), n_samples, dtype=torch.float32)
+    for i, audio_array in enumerate(audio_arrays):
+        length = min(len(audio_array), n_samples)
+        waveforms[i, :length] = torch.from_numpy(audio_array[:length])
+    waveforms = waveforms.to(device)
+    
+    window = torch.hann_window(feature_extractor.n_fft, device=device)
+    stft = torch.stft(
+        waveforms,
+        feature_extractor.n_fft,
+        feature_extractor.hop_length,
+        window=window,
+        return_complex=True
+    )
+    magnitudes = stft[..., :-1].abs() ** 2
+    
+    mel_filters = torch.from_numpy(feature_extractor.mel_filters).to(device, torch.float32)
+    mel_spec = mel_filters.T @ magnitudes
+    
+    log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+    max_val = log_spec.amax(dim=(1, 2), keepdim=True)
+    log_spec = torch.maximum(log_spec, max_val - 8.0)
+    log_spec = (log_spec + 4.0) / 4.0
+    
+    return log_spec.cpu().numpy()
+
+# S3 downloads in flight per batch; the pool must allow at least as many
+S3_PREFETCH_WORKERS = 32
+S3_CONFIG = Config(max_pool_connections=64, retries={'mode': 'adaptive'})
+
+# Per-process Whisper components; each dataset.map worker builds its own
+# on first use instead of pickling the tokenizer and boto3 client
+_worker_components = {}
+
+def get_worker_components(model_name, language, task, torch_threads=None):
+    """Feature extractor, tokenizer and S3 client for the current process"""
+    if not _worker_components:
+        # With one map process per core, torch's default of one intra-op
+        # thread per core in every process oversubscribes the CPU
+        if torch_threads:
+            torch.set_num_threads(torch_threads)
+        _worker_components['feature_extractor'] = WhisperFeatureExtractor.from_pretrained(model_name)
+        _worker_components['tokenizer'] = WhisperTokenizerFast.from_pretrained(model_name, language=language, task=task)
+        _worker_components['s3_client'] = boto3.client('s3', region_name='ap-southeast-1', config=S3_CONFIG)
+    return _worker_components
+
+@lru_cache(maxsize=1 << 16)
+def tokenize_text(text, model_name, language, task):
+    """Label ids for one transcript; repeated captions skip the tokenizer"""
+    tokenizer = get_worker_components(model_name, language, task)['tokenizer']
+    with tokenizer.as_target_tokenizer():
+        return tuple(tokenizer(text).input_ids)
+
+# One torchaudio resampler per source rate; the sinc kernel is built once
+_resamplers = {}
+
+def resample_to_16k(audio_array, sampling_rate):
+    """Resample a mono float32 array to 16kHz with a cached kernel"""
+    if sampling_rate not in _resamplers:
+        _resamplers[sampling_rate] = torchaudio.transforms.Resample(sampling_rate, 16000)
+    with torch.no_grad():
+        return _resamplers[sampling_rate](torch.from_numpy(audio_array)).numpy()
+
+def fetch_s3_audio(audio_path, s3_client):
+    """Download the raw bytes of one s3:// audio object"""
+    try:
+        # Parse S3 path
+        parts = audio_path.replace('s3://', '').split('/', 1)
+        bucket_name = parts[0]
+        s3_key = parts[1]
+        
+        # Download from S3
+        response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+        return response['Body'].read()
+    except Exception as e:
+        raise RuntimeError(f"FAILED to load audio from {audio_path}: {e}")
+
+def is_s3_path(audio_path):
+    """Whether a manifest path points at an S3 object"""
+    return isinstance(audio_path, str) and audio_path.startswith('s3://')
+
+def prefetch_s3_audio(s3_paths, s3_client):
+    """Download a batch's s3:// paths concurrently, keyed by path"""
+    if not s3_paths:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=S3_PREFETCH_WORKERS) as pool:
+        return dict(zip(s3_paths, pool.map(lambda path: fetch_s3_audio(path, s3_client), s3_paths)))
+
+def to_whisper_audio(audio_array, sampling_rate):
+    """Downmix a decoded float32 array to mono and resample it to 16kHz"""
+    # Ensure mono, staying in float32
+    if audio_array.ndim == 2:
+        audio_array = audio_array.mean(axis=1, dtype=np.float32)
+    
+    # Resample if needed
+    if sampling_rate != 16000:
+        audio_array = resample_to_16k(audio_array, sampling_rate)
+    
+    return audio_array
+
+def load_s3_audio(audio_path, audio_bytes):
+    """Decode prefetched S3 audio"""
+    try:
+        return to_whisper_audio(*sf.read(io.BytesIO(audio_bytes), dtype='float32', always_2d=False))
+    except Exception as e:
+        raise RuntimeError(f"FAILED to load audio from {audio_path}: {e}")
+
+def load_local_audio(audio_path):
+    """Load a local audio file"""
+    if not (isinstance(audio_path, str) and os.path.exists(audio_path)):
+        raise ValueError(f"Invalid audio path: {audio_path}")
+    
+    try:
+        # Decode straight into one float32 buffer sized from the header
+        with sf.SoundFile(audio_path) as f:
+            return to_whisper_audio(f.read(dtype='float32', always_2d=False), f.samplerate)
+    except Exception as e:
+        raise RuntimeError(f"FAILED to load local audio from {audio_path}: {e}")
+
+def load_audio(audio_path, audio_bytes=None):
+    """Load one sample's audio as mono float32 at 16kHz, from S3 or disk"""
+    if is_s3_path(audio_path):
+        return load_s3_audio(audio_path, audio_bytes)
+    return load_local_audio(audio_path)
+
+def detect_audio_source(audio_paths):
+    """'s3' or 'local' when a split uses one kind of path throughout, else 'mixed'"""
+    s3_count = sum(1 for audio_path in audio_paths if is_s3_path(audio_path))
+    if s3_count == len(audio_paths):
+        return 's3'
+    if s3_count == 0:
+        return 'local'
+    return 'mixed'
+
+def preprocess_batch(batch, model_name, language, task, feature_device, audio_source='mixed', torch_threads=None):
+    """Convert a batch: audio_filepath → input_features, text → labels"""
+    components = get_worker_components(model_name, language, task, torch_threads)
+    audio_paths = batch['audio_filepath']
+    
+    # Process audio with the loader the split was scanned for; S3 downloads
+    # overlap instead of paying one round-trip each
+    if audio_source == 'local':
+        audio_arrays = [load_local_audio(audio_path) for audio_path in audio_paths]
+    elif audio_source == 's3':
+        prefetched = prefetch_s3_audio(audio_paths, components['s3_client'])
+        audio_arrays = [load_s3_audio(audio_path, prefetched[audio_path]) for audio_path in audio_paths]
+    else:
+        s3_paths = [audio_path for audio_path in audio_paths if is_s3_path(audio_path)]
+        prefetched = prefetch_s3_audio(s3_paths, components['s3_client'])
+        audio_arrays = [load_audio(audio_path, prefetched.get(audio_path)) for audio_path in audio_paths]
+    
+    # Extract mel-spectrogram features for the whole batch at once
+    try:
+        input_features = batched_log_mel(audio_arrays, components['feature_extractor'], feature_device)
+    except Exception as e:
+        raise RuntimeError(f"FAILED to extract features from audio: {e}")
+    
+    # Tokenize text
+    labels = []
+    texts = batch['text'] if 'text' in batch else [''] * len(audio_arrays)
+    for text in texts:
+        text = str(text if text is not None else '').strip()
+        if not text:
+            raise ValueError("Empty or missing text field")
+        
+        try:
+            labels.append(list(tokenize_text(text, model_name, language, task)))
+        except Exception as e:
+            raise RuntimeError(f"FAILED to tokenize text '{text}': {e}")
+    
+    return {
+        'input_features': list(input_features),
+        'labels': labels
+    }
+
 def preprocess_whisper_datasets(input_dir, output_dir, 
                                model_name='openai/whisper-tiny',
                                language='km', task='transcribe'):
@@ -50,95 +239,19 @@ def preprocess_whisper_datasets(input_dir, output_dir,
         print(f"Error: {e}")
         sys.exit(1)
     
-    # Initialize Whisper components
+    # Whisper components are loaded inside each map process by get_worker_components
     print(f"\n🔧 Initializing Whisper components ({model_name})...")
     try:
-        feature_extractor = WhisperFeatureExtractor.from_pretrained(model_name)
-        tokenizer = WhisperTokenizer.from_pretrained(model_name, language=language, task=task)
-        s3_client = boto3.client('s3', region_name='ap-southeast-1')
-        print("✅ Components initialized successfully")
+        feature_device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # CPU feature extraction scales across processes; a single GPU
+        # process already batches the heavy work
+        num_proc = 1 if feature_device == 'cuda' else (os.cpu_count() or 1)
+        torch_threads = 1 if num_proc > 1 else None
+        print(f"✅ Components initialized successfully (features on {feature_device}, {num_proc} process(es))")
     except Exception as e:
         print(f"❌ FAILED to initialize Whisper components: {e}")
         sys.exit(1)
     
-    def preprocess_sample(sample):
-        """Convert one sample: audio_filepath → input_features, text → labels"""
-        
-        # Process audio
-        audio_path = sample['audio_filepath']
-        
-        if isinstance(audio_path, str) and audio_path.startswith('s3://'):
-            # Load real S3 audio
-            try:
-                # Parse S3 path
-                parts = audio_path.replace('s3://', '').split('/', 1)
-                bucket_name = parts[0]
-                s3_key = parts[1]
-                
-                # Download from S3
-                response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-                audio_bytes = response['Body'].read()
-                
-                # Load audio
-                audio_array, sampling_rate = sf.read(io.BytesIO(audio_bytes))
-                
-                # Ensure mono and float32
-                if len(audio_array.shape) > 1:
-                    audio_array = np.mean(audio_array, axis=1)
-                audio_array = audio_array.astype(np.float32)
-                
-                # Resample if needed
-                if sampling_rate != 16000:
-                    import librosa
-                    audio_array = librosa.resample(audio_array, orig_sr=sampling_rate, target_sr=16000)
-                
-            except Exception as e:
-                raise RuntimeError(f"FAILED to load audio from {audio_path}: {e}")
-        
-        elif isinstance(audio_path, str) and os.path.exists(audio_path):
-            # Load local file
-            try:
-                audio_array, sampling_rate = sf.read(audio_path)
-                if len(audio_array.shape) > 1:
-                    audio_array = np.mean(audio_array, axis=1)
-                audio_array = audio_array.astype(np.float32)
-                
-                if sampling_rate != 16000:
-                    import librosa
-                    audio_array = librosa.resample(audio_array, orig_sr=sampling_rate, target_sr=16000)
-                    
-            except Exception as e:
-                raise RuntimeError(f"FAILED to load local audio from {audio_path}: {e}")
-        
-        else:
-            raise ValueError(f"Invalid audio path: {audio_path}")
-        
-        # Extract mel-spectrogram features
-        try:
-            input_features = feature_extractor(
-                audio_array,
-                sampling_rate=16000,
-                return_tensors="np"
-            ).input_features[0]
-        except Exception as e:
-            raise RuntimeError(f"FAILED to extract features from audio: {e}")
-        
-        # Tokenize text
-        text = str(sample.get('text', '')).strip()
-        if not text:
-            raise ValueError("Empty or missing text field")
-        
-        try:
-            with tokenizer.as_target_tokenizer():
-                labels = tokenizer(text).input_ids
-        except Exception as e:
-            raise RuntimeError(f"FAILED to tokenize text '{text}': {e}")
-        
-        return {
-            'input_features': input_features,
-            'labels': labels
-        }
-    
     # Process each split
     processed_datasets = {}
     
@@ -146,12 +259,27 @@ def preprocess_whisper_datasets(input_dir, output_dir,
         print(f"\n🔄 Processing {split_name} split ({len(dataset):,} samples)...")
         
         try:
+            # Scan the paths once so every batch runs a single loader
+            audio_source = detect_audio_source(dataset['audio_filepath'])
+            print(f"   Audio source: {audio_source}")
+            
             # Apply preprocessing - this will FAIL on any error
             processed_dataset = dataset.map(
-                preprocess_sample,
+                preprocess_batch,
+                batched=True,
+                batch_size=64,  # One STFT launch per 64 samples
+                fn_kwargs={
+                    'model_name': model_name,
+                    'language': language,
+                    'task': task,
+                    'feature_device': feature_device,
+                    'audio_source': audio_source,
+                    'torch_threads': torch_threads
+                },
                 remove_columns=dataset.column_names,  # Remove ALL original columns
                 desc=f"Converting {split_name}",
-                num_proc=1  # Single process for clearer error messages
+                num_proc=num_proc,
+                writer_batch_size=1000
             )
             
             processed_datasets[split_name] = processed_dataset
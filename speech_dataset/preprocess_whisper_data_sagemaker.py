@@ -9,136 +9,271 @@ import sys
 import json
 import pandas as pd
 import numpy as np
-import torch
+import pyarrow as pa
+import pyarrow.compute as pc
 import boto3
 import soundfile as sf
 import io
+import hashlib
+import atexit
+import shutil
+import tempfile
+from functools import partial
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from tqdm import tqdm
-from datasets import Dataset, DatasetDict
+from datasets import Array2D, Audio, DatasetDict, Features, Sequence, Value, load_from_disk
+from datasets.fingerprint import Hasher
 from transformers import WhisperFeatureExtractor, WhisperTokenizer
 import warnings
 warnings.filterwarnings("ignore")
 
+# Resampler, imported once: soxr if installed, else librosa
+try:
+    import soxr
+    librosa = None
+except ImportError:
+    soxr = None
+    import librosa
+
+# Threads per worker that fetch, decode and resample a batch's samples.
+# S3 socket I/O, libsndfile and the NumPy/numba resampling kernels all
+# release the GIL, so threads overlap network waits with decoding. A single
+# process gets the full pool; with one map process per CPU, each keeps a
+# small I/O-sized pool so resampling does not oversubscribe the cores.
+SAMPLE_LOAD_THREADS = min(32, 4 * (os.cpu_count() or 1))
+SAMPLE_LOAD_THREADS_PER_PROCESS = 4
+
+def sample_load_threads(num_proc):
+    """Loader threads for each of num_proc map processes"""
+    return SAMPLE_LOAD_THREADS if num_proc == 1 else SAMPLE_LOAD_THREADS_PER_PROCESS
+
+# Rows buffered per Arrow write by Dataset.map; bounds memory per worker
+WRITER_BATCH_SIZE = 1000
+
+# Per-process Whisper components and S3 client, built once by _ensure_worker
+# instead of being pickled with every batch (boto3 clients are not fork-safe)
+_worker = {}
+
+def _ensure_worker(model_name, language, task, cache_dir=None, load_threads=SAMPLE_LOAD_THREADS_PER_PROCESS):
+    """Load everything a batch needs, once per map worker process"""
+    worker_key = (model_name, language, task, cache_dir, load_threads)
+    if _worker.get('key') == worker_key:
+        return
+    _worker['key'] = worker_key
+    _worker['cache_dir'] = Path(cache_dir) if cache_dir else None
+    _worker['feature_extractor'] = WhisperFeatureExtractor.from_pretrained(model_name)
+    _worker['tokenizer'] = WhisperTokenizer.from_pretrained(model_name, language=language, task=task)
+    # Language/task prefix tokens are fixed once here, not per call
+    _worker['tokenizer'].set_prefix_tokens(language=language, task=task)
+    # One pooled S3 connection per loader thread
+    _worker['s3_client'] = boto3.client('s3', config=Config(max_pool_connections=load_threads))
+    _worker['load_pool'] = ThreadPoolExecutor(max_workers=load_threads)
+
+def resample_to_16k(audio_array, sampling_rate):
+    """Resample to 16kHz with soxr's C polyphase kernel, else librosa"""
+    if soxr is not None:
+        return soxr.resample(audio_array, sampling_rate, 16000, quality='HQ')
+    return librosa.resample(audio_array, orig_sr=sampling_rate, target_sr=16000)
+
+def split_s3_uri(uri):
+    """'s3://bucket/key/parts' -> ('bucket', 'key/parts')"""
+    bucket_name, _, s3_key = uri[len('s3://'):].partition('/')
+    return bucket_name, s3_key
+
+def to_mono(audio_array):
+    """Average (frames, channels) audio down to mono in a single float32 pass"""
+    if audio_array.ndim > 1:
+        return np.mean(audio_array, axis=1, dtype=np.float32)
+    return audio_array
+
+def _audio_cache_path(bucket_name, s3_key):
+    """Where the resampled audio of one S3 object is cached, or None"""
+    if _worker.get('cache_dir') is None:
+        return None
+    key = hashlib.blake2b(f"{bucket_name}/{s3_key}".encode(), digest_size=16).hexdigest()
+    return _worker['cache_dir'] / key[:2] / f"{key}.npy"
+
+def load_s3_audio(audio_uri):
+    """Download, decode and resample one S3 object, via the local cache if set"""
+    bucket_name, s3_key = split_s3_uri(audio_uri)
+    cache_path = _audio_cache_path(bucket_name, s3_key)
+    if cache_path is not None and cache_path.exists():
+        return np.load(cache_path)
+    
+    # Download audio
+    response = _worker['s3_client'].get_object(Bucket=bucket_name, Key=s3_key)
+    audio_bytes = response['Body'].read()
+    
+    # Load with soundfile, decoding straight to float32
+    audio_array, sampling_rate = sf.read(io.BytesIO(audio_bytes), dtype='float32')
+    audio_array = to_mono(audio_array)
+    
+    # Resample if needed
+    if sampling_rate != 16000:
+        audio_array = resample_to_16k(audio_array, sampling_rate)
+    
+    if cache_path is not None:
+        # Write-then-rename so concurrent workers never read a partial file
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            # float32 as returned, so a cache hit feeds the exact same samples
+            np.save(f, audio_array)
+        os.replace(tmp_path, cache_path)
+    
+    return audio_array
+
+def load_decoded_audio(audio_data, needs_resample=True):
+    """Mono 16kHz float32 array from an already-decoded HuggingFace Audio value"""
+    audio_array = audio_data['array']
+    
+    # Convert to numpy array if needed
+    if hasattr(audio_array, 'numpy'):
+        audio_array = audio_array.numpy()
+    audio_array = to_mono(np.asarray(audio_array, dtype=np.float32))
+    
+    # Resample if needed; skipped outright when the column is known to be 16kHz
+    if needs_resample and audio_data['sampling_rate'] != 16000:
+        audio_array = resample_to_16k(audio_array, audio_data['sampling_rate'])
+    return audio_array
+
+def classify_audio_column(dataset, audio_column):
+    """Work out once per split how its audio is stored: (kind, needs_resample)"""
+    feature = dataset.features.get(audio_column)
+    if isinstance(feature, Audio):
+        # A cast Audio column states its rate; None keeps each file's own
+        return 'decoded', feature.sampling_rate != 16000
+    
+    first_value = dataset[0][audio_column]
+    if isinstance(first_value, dict):
+        return 'decoded', True
+    if isinstance(first_value, str) and first_value.startswith('s3://'):
+        return 's3', True
+    raise ValueError(f"Unsupported audio format: {type(first_value)}")
+
+def fetch_audio(load_audio, audio_data, text):
+    """Load one sample as (mono 16kHz float32 array, text); text arrives trimmed"""
+    if not text:
+        raise ValueError("Empty text")
+    return load_audio(audio_data), text
+
+def try_fetch_audio(load_audio, audio_data, text):
+    """fetch_audio, reporting and skipping a failed sample"""
+    try:
+        return fetch_audio(load_audio, audio_data, text)
+    except Exception as e:
+        print(f"⚠️ Sample failed: {e}")
+        return None
+
+def process_batch(batch, audio_column, audio_kind, needs_resample,
+                  model_name, language, task, cache_dir=None,
+                  load_threads=SAMPLE_LOAD_THREADS_PER_PROCESS):
+    """Dataset.map function: turn a batch of audio/text rows into Whisper inputs"""
+    _ensure_worker(model_name, language, task, cache_dir, load_threads)
+    # The split's audio layout was classified once up front, so samples go
+    # straight to the matching loader with no per-sample format checks
+    if audio_kind == 's3':
+        load_audio = load_s3_audio
+    else:
+        load_audio = partial(load_decoded_audio, needs_resample=needs_resample)
+    audios = batch[audio_column]
+    # Trim the whole text column in Arrow rather than per sample
+    # (a split without a text column yields empty texts, which are skipped)
+    texts = batch['text'] if 'text' in batch else [''] * len(audios)
+    texts = pc.utf8_trim_whitespace(pa.array(texts, type=pa.string())).to_pylist()
+    feature_extractor = _worker['feature_extractor']
+    tokenizer = _worker['tokenizer']
+    batch_results = {
+        'input_features': [],
+        'labels': [],
+        'length': []
+    }
+    
+    # Pass 1: load every sample on the thread pool; a failure only drops that sample
+    loaded = [item for item in _worker['load_pool'].map(partial(try_fetch_audio, load_audio), audios, texts) if item is not None]
+    if not loaded:
+        return batch_results
+    arrays = [audio_array for audio_array, _ in loaded]
+    texts = [text for _, text in loaded]
+    
+    # Pass 2: one feature extractor call and one tokenizer call per batch.
+    # Features are stored as float16: the encoder trains in fp16 and log-mel
+    # values in [-1.5, 1.5] lose nothing that matters at that precision
+    try:
+        input_features = feature_extractor(
+            arrays,
+            sampling_rate=16000,
+            return_tensors="np"
+        ).input_features.astype(np.float16)
+        
+        labels = tokenizer(texts, add_special_tokens=True, return_attention_mask=False)['input_ids']
+    except Exception as e:
+        print(f"⚠️ Batch failed: {e}")
+        return batch_results
+    
+    # Whole typed arrays rather than per-row lists: the (N, 80, 3000) float16
+    # block goes into the Array2D column without walking each sample
+    batch_results['input_features'] = input_features
+    batch_results['labels'] = labels
+    batch_results['length'] = np.fromiter(map(len, labels), dtype=np.int32, count=len(labels))
+    
+    return batch_results
+
 def preprocess_for_sagemaker(datasets, output_dir=None, 
                             model_name='openai/whisper-tiny',
                             language='km', task='transcribe',
                             max_samples_per_split=None,
-                            batch_size=10):
+                            batch_size=10,
+                            num_workers=None,
+                            cache_dir=None):
     """
     SageMaker-optimized preprocessing that works with your loaded datasets
     
     Args:
         datasets: Your loaded DatasetDict from the notebook
         output_dir: Optional - where to save processed datasets  
+            (Dataset.map's Arrow cache files are built in a temporary directory
+            and removed once the save completes, so only one copy of the
+            features lands on disk; the returned datasets are loaded back from
+            output_dir. Without it the temporary files back the returned
+            datasets and are removed at interpreter exit)
         max_samples_per_split: Limit samples to avoid memory issues
         batch_size: Process in small batches to avoid memory problems
+        num_workers: Dataset.map processes for feature extraction (default: one per CPU)
+        cache_dir: Optional - local cache of resampled S3 audio (float32 .npy),
+            e.g. '/opt/ml/input/data/cache' on the instance's NVMe; re-runs
+            then skip the S3 download and resampling
     """
     
     print("🔄 SAGEMAKER WHISPER PREPROCESSING")
     print("=" * 50)
     
-    # Use SageMaker's built-in S3 client (inherits IAM role)
-    try:
-        s3_client = boto3.client('s3')
-        print("✅ Using SageMaker IAM role for S3 access")
-    except Exception as e:
-        print(f"❌ S3 client failed: {e}")
-        return None
-    
-    # Initialize Whisper components
-    print(f"🔧 Loading Whisper components ({model_name})...")
+    # The feature extractor supplies the output feature shape; the map
+    # worker processes build their own components and S3 client in _ensure_worker
+    print(f"🔧 Loading Whisper feature extractor ({model_name})...")
     try:
         feature_extractor = WhisperFeatureExtractor.from_pretrained(model_name)
-        tokenizer = WhisperTokenizer.from_pretrained(model_name, language=language, task=task)
-        print("✅ Whisper components loaded")
+        print("✅ Whisper feature extractor loaded")
     except Exception as e:
-        print(f"❌ Failed to load Whisper components: {e}")
+        print(f"❌ Failed to load Whisper feature extractor: {e}")
         return None
     
-    def process_batch(batch_samples):
-        """Process a small batch of samples"""
-        batch_results = {
-            'input_features': [],
-            'labels': []
-        }
-        
-        for sample in batch_samples:
-            try:
-                # Handle different audio formats
-                audio_data = sample.get('audio_filepath') or sample.get('audio')
-                
-                if isinstance(audio_data, dict):
-                    # Audio is already loaded (HuggingFace Audio column format)
-                    audio_array = audio_data['array']
-                    sampling_rate = audio_data['sampling_rate']
-                    
-                    # Convert to numpy array if needed
-                    if hasattr(audio_array, 'numpy'):
-                        audio_array = audio_array.numpy()
-                    audio_array = np.array(audio_array, dtype=np.float32)
-                    
-                    # Ensure mono
-                    if len(audio_array.shape) > 1:
-                        audio_array = np.mean(audio_array, axis=1)
-                    
-                    # Resample if needed
-                    if sampling_rate != 16000:
-                        import librosa
-                        audio_array = librosa.resample(audio_array, orig_sr=sampling_rate, target_sr=16000)
-                
-                elif isinstance(audio_data, str) and audio_data.startswith('s3://'):
-                    # Need to load from S3 path
-                    parts = audio_data.replace('s3://', '').split('/', 1)
-                    bucket_name = parts[0]
-                    s3_key = parts[1]
-                    
-                    # Download audio
-                    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
-                    audio_bytes = response['Body'].read()
-                    
-                    # Load with soundfile
-                    audio_array, sampling_rate = sf.read(io.BytesIO(audio_bytes))
-                    
-                    # Convert to mono float32
-                    if len(audio_array.shape) > 1:
-                        audio_array = np.mean(audio_array, axis=1)
-                    audio_array = audio_array.astype(np.float32)
-                    
-                    # Resample if needed
-                    if sampling_rate != 16000:
-                        import librosa
-                        audio_array = librosa.resample(audio_array, orig_sr=sampling_rate, target_sr=16000)
-                
-                else:
-                    raise ValueError(f"Unsupported audio format: {type(audio_data)}")
-                
-                # Extract features
-                input_features = feature_extractor(
-                    audio_array,
-                    sampling_rate=16000,
-                    return_tensors="np"
-                ).input_features[0]
-                
-                # Tokenize text
-                text = str(sample.get('text', '')).strip()
-                if not text:
-                    raise ValueError("Empty text")
-                
-                with tokenizer.as_target_tokenizer():
-                    labels = tokenizer(text).input_ids
-                
-                batch_results['input_features'].append(input_features)
-                batch_results['labels'].append(labels)
-                
-            except Exception as e:
-                print(f"⚠️ Sample failed: {e}")
-                continue
-        
-        return batch_results
+    # Dataset.map streams processed samples to memory-mapped Arrow cache files
+    # in a scratch directory; without output_dir the returned datasets stay
+    # memory-mapped from it, so it is removed at exit at the latest
+    shard_root = Path(tempfile.mkdtemp(prefix="whisper_shards_"))
+    atexit.register(shutil.rmtree, shard_root, ignore_errors=True)
+    features = Features({
+        'input_features': Array2D((feature_extractor.feature_size, feature_extractor.nb_max_frames), 'float16'),
+        'labels': Sequence(Value('int32')),
+        # Label lengths let the Trainer's length-grouped sampler skip its own scan
+        'length': Value('int32')
+    })
     
     # Process each split
     processed_splits = {}
+    num_proc = num_workers or os.cpu_count() or 1
     
     for split_name, dataset in datasets.items():
         print(f"\n🔄 Processing {split_name} split...")
@@ -148,31 +283,54 @@ def preprocess_for_sagemaker(datasets, output_dir=None,
             dataset = dataset.select(range(max_samples_per_split))
             print(f"🔧 Limited to {max_samples_per_split} samples")
         
-        # Process in batches
-        all_input_features = []
-        all_labels = []
-        
-        for i in tqdm(range(0, len(dataset), batch_size), desc=f"Processing {split_name}"):
-            batch_indices = range(i, min(i + batch_size, len(dataset)))
-            batch_samples = [dataset[idx] for idx in batch_indices]
-            
-            batch_results = process_batch(batch_samples)
-            
-            all_input_features.extend(batch_results['input_features'])
-            all_labels.extend(batch_results['labels'])
-            
-            # Free memory periodically
-            if i % (batch_size * 10) == 0:
-                torch.cuda.empty_cache() if torch.cuda.is_available() else None
+        # Batched map over worker processes; a batch may come back shorter
+        # than it went in, since failed samples are dropped. map() starts its
+        # own pool per split, so each split's workers load the Whisper
+        # components once in _ensure_worker (this superseded the single pool
+        # shared across splits)
+        audio_column = 'audio_filepath' if 'audio_filepath' in dataset.column_names else 'audio'
+        if not len(dataset):
+            print(f"❌ {split_name}: No samples processed successfully")
+            continue
+        try:
+            audio_kind, needs_resample = classify_audio_column(dataset, audio_column)
+        except ValueError as e:
+            print(f"❌ {split_name}: {e}")
+            continue
+        fn_kwargs = {
+            'audio_column': audio_column,
+            'audio_kind': audio_kind,
+            'needs_resample': needs_resample,
+            'model_name': model_name,
+            'language': language,
+            'task': task,
+            'cache_dir': cache_dir,
+            'load_threads': sample_load_threads(num_proc)
+        }
+        # map() loads an explicitly named cache file whenever it exists, with
+        # no fingerprint check, so the name itself carries the cache key: the
+        # input's fingerprint (covers max_samples_per_split), the function and
+        # every argument
+        cache_key = Hasher.hash([dataset._fingerprint, process_batch, fn_kwargs, batch_size, features])
+        split_dir = shard_root / split_name
+        split_dir.mkdir(parents=True, exist_ok=True)
+        processed = dataset.map(
+            process_batch,
+            batched=True,
+            batch_size=batch_size,
+            num_proc=num_proc,
+            fn_kwargs=fn_kwargs,
+            remove_columns=dataset.column_names,
+            features=features,
+            cache_file_name=str(split_dir / f"{split_name}-{cache_key}.arrow"),
+            load_from_cache_file=True,
+            writer_batch_size=WRITER_BATCH_SIZE,
+            desc=f"Processing {split_name}"
+        )
         
-        if all_input_features:
-            # Create processed dataset
-            processed_data = {
-                'input_features': all_input_features,
-                'labels': all_labels
-            }
-            processed_splits[split_name] = Dataset.from_dict(processed_data)
-            print(f"✅ {split_name}: {len(all_input_features)} samples processed")
+        if len(processed):
+            processed_splits[split_name] = processed
+            print(f"✅ {split_name}: {len(processed)} samples processed")
         else:
             print(f"❌ {split_name}: No samples processed successfully")
     
@@ -186,10 +344,14 @@ def preprocess_for_sagemaker(datasets, output_dir=None,
     if output_dir:
         print(f"\n💾 Saving processed datasets to {output_dir}...")
         processed_datasets.save_to_disk(output_dir)
+        # Serve the saved copy and drop the map cache, so the features are
+        # not kept on disk twice
+        processed_datasets = load_from_disk(output_dir)
+        shutil.rmtree(shard_root, ignore_errors=True)
         print("✅ Datasets saved")
     
     print(f"\n🎉 PREPROCESSING COMPLETE!")
-    print(f"✅ Processed {sum(len(d) for d in processed_splits.values())} total samples")
+    print(f"✅ Processed {sum(len(d) for d in processed_datasets.values())} total samples")
     
     return processed_datasets
 
@@ -198,4 +360,4 @@ if __name__ == "__main__":
     print("💡 This script is designed to be imported in your SageMaker notebook")
     print("💡 Usage in notebook:")
     print("   from preprocess_whisper_data_sagemaker import preprocess_for_sagemaker")
-    print("   processed_datasets = preprocess_for_sagemaker(datasets, max_samples_per_split=1000)")
\ No newline at end of file
+    print("   processed_datasets = preprocess_for_sagemaker(datasets, max_samples_per_split=1000)")
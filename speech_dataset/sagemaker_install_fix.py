@@ -37,6 +37,9 @@ def fix_sagemaker_packages():
         ("pip install transformers>=4.35.0 --no-cache-dir", "Installing Transformers"),
         ("pip install datasets>=2.14.0 --no-cache-dir", "Installing Datasets"),
         
+        # soxr is the preferred resampler; librosa below stays as the fallback
+        ("pip install soxr --no-cache-dir", "Installing soxr"),
+        
         # Install numba first (critical for librosa) - try conda first
         ("conda install -c conda-forge numba -y", "Installing numba via conda"),
         
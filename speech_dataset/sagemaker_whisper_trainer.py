@@ -9,12 +9,35 @@ using SageMaker ml.g4dn.2xlarge instances.
 
 import json
 import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
 import sagemaker
 from sagemaker.pytorch import PyTorch
 from sagemaker.inputs import TrainingInput
 from datetime import datetime
 import os
 
+# Concurrent S3 part uploads; the client pool is sized to match
+UPLOAD_CONCURRENCY = 64
+
+def iter_upload_files(root, prefix=""):
+    """Yield (local_path, relative_key, size) for every file under root, skipping bytecode"""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name != "__pycache__":
+                    yield from iter_upload_files(entry.path, f"{prefix}{entry.name}/")
+            elif not entry.name.endswith(".pyc"):
+                yield entry.path, f"{prefix}{entry.name}", entry.stat().st_size
+
+def list_object_sizes(s3_client, bucket, prefix):
+    """Map each key under prefix to its size in bytes"""
+    sizes = {}
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            sizes[obj['Key']] = obj['Size']
+    return sizes
+
 class SageMakerWhisperTrainer:
     """SageMaker Whisper training job manager"""
     
@@ -36,16 +59,33 @@ class SageMakerWhisperTrainer:
         # Upload dataset
         dataset_s3_path = f"s3://{self.bucket}/khmer-whisper-dataset"
         
-        # Use AWS CLI for faster upload
-        import subprocess
-        subprocess.run([
-            "aws", "s3", "sync", 
-            dataset_path, 
-            f"{dataset_s3_path}/data",
-            "--exclude", "*.pyc",
-            "--exclude", "__pycache__/*"
-        ], check=True)
+        # One transfer manager schedules every file's parts on a shared pool
+        s3_client = boto3.client(
+            's3', region_name=self.region,
+            config=Config(max_pool_connections=UPLOAD_CONCURRENCY)
+        )
+        transfer_config = TransferConfig(
+            max_concurrency=UPLOAD_CONCURRENCY,
+            multipart_threshold=8 * 1024 * 1024,
+            multipart_chunksize=16 * 1024 * 1024,
+            use_threads=True
+        )
+        # Files already in the bucket with the same size are left alone, so
+        # re-running after a partial upload only sends what is missing
+        key_prefix = "khmer-whisper-dataset/data/"
+        existing = list_object_sizes(s3_client, self.bucket, key_prefix)
+        skipped = 0
+        futures = []
+        with create_transfer_manager(s3_client, transfer_config) as manager:
+            for local_path, key, size in iter_upload_files(dataset_path):
+                if existing.get(key_prefix + key) == size:
+                    skipped += 1
+                    continue
+                futures.append(manager.upload(local_path, self.bucket, key_prefix + key))
+            for future in futures:
+                future.result()
         
+        print(f"   📁 Uploaded {len(futures)} files ({skipped} already up to date)")
         print(f"✅ Dataset uploaded to: {dataset_s3_path}")
         return dataset_s3_path
     
@@ -6,8 +6,9 @@ Example Usage of Khmer Speech Dataset
 This script demonstrates how to use the built speech dataset with different frameworks.
 """
 
-import json
+import orjson
 import pandas as pd
+from itertools import islice
 from pathlib import Path
 
 def basic_data_exploration():
@@ -15,8 +16,8 @@ def basic_data_exploration():
     print("=== KHMER SPEECH DATASET EXPLORATION ===\n")
     
     # Load dataset info
-    with open('dataset/dataset_info.json', 'r') as f:
-        info = json.load(f)
+    with open('dataset/dataset_info.json', 'rb') as f:
+        info = orjson.loads(f.read())
     
     print("Dataset Overview:")
     print(f"- Name: {info['dataset_name']}")
@@ -92,8 +93,8 @@ def manual_loading_example():
     print("=== MANUAL LOADING EXAMPLE ===")
     
     # Load manifest manually
-    with open('dataset/train/train_manifest.jsonl', 'r') as f:
-        samples = [json.loads(line) for line in f.readlines()[:5]]
+    with open('dataset/train/train_manifest.jsonl', 'rb') as f:
+        samples = [orjson.loads(line) for line in islice(f, 5)]
     
     print("First 5 training samples:")
     for i, sample in enumerate(samples):
@@ -6,7 +6,7 @@ Test Merged Dataset
 Quick script to verify your merged dataset is ready for training.
 """
 
-import json
+import orjson
 import pandas as pd
 from pathlib import Path
 
@@ -18,8 +18,8 @@ def test_merged_dataset():
     
     # Check dataset info
     if (dataset_dir / "dataset_info.json").exists():
-        with open(dataset_dir / "dataset_info.json", 'r') as f:
-            info = json.load(f)
+        with open(dataset_dir / "dataset_info.json", 'rb') as f:
+            info = orjson.loads(f.read())
         
         print("📊 Dataset Overview:")
         print(f"   Total Samples: {info['statistics']['total_samples']:,}")
@@ -63,8 +63,8 @@ def test_merged_dataset():
     try:
         train_manifest = dataset_dir / "train" / "train_hf.jsonl"
         if train_manifest.exists():
-            with open(train_manifest, 'r', encoding='utf-8') as f:
-                sample = json.loads(f.readline())
+            with open(train_manifest, 'rb') as f:
+                sample = orjson.loads(f.readline())
             
             print("   ✅ Manifest format: OK")
             print(f"   📝 Sample transcription: {sample['transcription'][:50]}...")
@@ -11,6 +11,7 @@ Train on your MEGA dataset with 138+ hours of diverse Khmer speech:
 
 import os
 import json
+import orjson
 import torch
 import pandas as pd
 import numpy as np
@@ -29,20 +30,150 @@ from transformers import (
     Trainer,
     EarlyStoppingCallback
 )
-from datasets import Dataset, DatasetDict, Audio
-import librosa
+from datasets import Dataset, DatasetDict, Features, Value, concatenate_datasets
+from jiwer import cer as jiwer_cer
 import soundfile as sf
+import torchaudio.functional as AF
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def cache_waveforms(audio_paths, npy_paths, speeds, target_sampling_rate=16000):
+    """Decode each WAV once and save it as a mono float16 .npy next to it"""
+    for audio_path, npy_path, speed in zip(audio_paths, npy_paths, speeds):
+        # Reuse a cached waveform only if it is newer than its WAV, so a
+        # regenerated file is decoded again
+        if os.path.exists(npy_path) and os.stat(npy_path).st_mtime_ns >= os.stat(audio_path).st_mtime_ns:
+            continue
+        audio_array, sampling_rate = sf.read(audio_path, dtype='float32')
+        if audio_array.ndim > 1:
+            audio_array = np.mean(audio_array, axis=1, dtype=np.float32)
+        # Kaldi-style speed perturbation is a resample from a scaled rate, so
+        # it folds into the same resample call as any rate conversion. Files
+        # already at 16kHz skip it; torchaudio's C++ kernel handles the rest
+        source_rate = round(sampling_rate * speed)
+        if source_rate != target_sampling_rate:
+            audio_array = AF.resample(
+                torch.from_numpy(audio_array), source_rate, target_sampling_rate
+            ).numpy()
+        # Write-then-rename so a crashed run never leaves a truncated cache file
+        tmp_path = f"{npy_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, audio_array.astype(np.float16))
+        os.replace(tmp_path, npy_path)
+    return {'npy_path': npy_paths}
+
+MANIFEST_FEATURES = Features({
+    'audio_path': Value('string'),
+    'npy_path': Value('string'),
+    'speed': Value('float64'),
+    'transcription': Value('string'),
+    'duration': Value('float64'),
+    'speaker_id': Value('string'),
+    'source': Value('string')
+})
+
+def convert_to_sharded_manifest(manifest_path: Path, num_shards: int) -> List[Path]:
+    """Split a JSONL manifest into num_shards contiguous shards (reused while fresh)"""
+    shard_paths = [
+        manifest_path.with_name(f"{manifest_path.stem}__{i}_of_{num_shards}{manifest_path.suffix}")
+        for i in range(num_shards)
+    ]
+    manifest_mtime = manifest_path.stat().st_mtime_ns
+    if all(p.exists() and p.stat().st_mtime_ns >= manifest_mtime for p in shard_paths):
+        return shard_paths
+    
+    with open(manifest_path, 'rb') as f:
+        lines = f.readlines()
+    shard_size = -(-len(lines) // num_shards)
+    for i, shard_path in enumerate(shard_paths):
+        with open(shard_path, 'wb') as f:
+            f.writelines(lines[i * shard_size:(i + 1) * shard_size])
+    return shard_paths
+
+def iter_manifest_rows(shard_paths, audio_dir, manifest_version=None):
+    """Dataset.from_generator source: one row per manifest entry with audio"""
+    # manifest_version is unused; it only keys from_generator's cache to the manifest
+    audio_dir = Path(audio_dir)
+    for shard_path in shard_paths:
+        with open(shard_path, 'rb') as f:
+            for line in f:
+                item = orjson.loads(line)
+                if 'audio' in item and 'path' in item['audio']:
+                    # Fix audio path
+                    audio_path = item['audio']['path']
+                    if audio_path.startswith('audio/'):
+                        audio_path = audio_path[6:]
+                    full_audio_path = audio_dir / "audio" / audio_path
+                    
+                    yield {
+                        'audio_path': str(full_audio_path),
+                        'npy_path': f"{full_audio_path}.npy",
+                        'speed': 1.0,
+                        'transcription': item['transcription'],
+                        'duration': item['duration'],
+                        'speaker_id': item.get('speaker_id', 'unknown'),
+                        'source': item.get('source', 'unknown')
+                    }
+
+def augment_audio(audio_array: np.ndarray) -> np.ndarray:
+    """Apply data augmentation"""
+    # Add background noise
+    if np.random.random() < 0.2:
+        noise_factor = np.random.uniform(0.001, 0.005)
+        noise = np.random.normal(0, noise_factor, audio_array.shape)
+        audio_array = audio_array + noise
+    
+    # Volume perturbation
+    if np.random.random() < 0.3:
+        volume_factor = np.random.uniform(0.8, 1.2)
+        audio_array = audio_array * volume_factor
+        
+    # Normalize and clip
+    audio_array = np.clip(audio_array, -1.0, 1.0)
+    
+    return audio_array
+
+def preprocess_function(examples, processor, target_sampling_rate, use_data_augmentation):
+    """Preprocess audio and text (module-level so map workers never pickle the model)"""
+    # Process audio with augmentation; waveforms come memory-mapped
+    # from the .npy cache instead of being decoded again
+    audio_arrays = []
+    for npy_path in examples["npy_path"]:
+        audio_array = np.load(npy_path, mmap_mode='r').astype(np.float32)
+        
+        # Apply augmentation during training
+        if use_data_augmentation:
+            audio_array = augment_audio(audio_array)
+        
+        audio_arrays.append(audio_array)
+    
+    # No padding here: the data collator pads each training batch, so the
+    # cache holds no padding from these much larger map batches
+    inputs = processor(
+        audio_arrays, 
+        sampling_rate=target_sampling_rate
+    )
+    
+    # Process text
+    with processor.as_target_processor():
+        labels = processor(examples["transcription"]).input_ids
+    
+    inputs["labels"] = labels
+    # Samples per clip, for group_by_length to read instead of measuring
+    inputs["input_length"] = [len(audio_array) for audio_array in audio_arrays]
+    return inputs
+
 @dataclass
 class FinalModelConfig:
     """Configuration for training on the mega dataset"""
     model_name: str = "facebook/wav2vec2-base"  # or wav2vec2-large for better quality
     output_dir: str = "./khmer-asr-final"
     dataset_dir: str = "./fixed_mega_dataset"
+    # Arrow cache for the manifests and every map() built on them; keep it on
+    # local SSD/NVMe scratch, not a home or NFS mount
+    cache_dir: str = "/tmp/khmer-asr-cache"
     
     # Training parameters optimized for 138+ hours
     num_train_epochs: int = 20  # More epochs for large dataset
@@ -61,6 +192,12 @@ class FinalModelConfig:
     
     # Data augmentation (recommended for diverse dataset)
     use_data_augmentation: bool = True
+    # Speed-perturbed copies of the training set, generated once up front
+    speed_perturbation_rates: tuple = (0.9, 1.1)
+    
+    # Compile the model's forward/backward with torch.compile (PyTorch 2.x);
+    # opt-in, and disables layerdrop, whose random layer skipping breaks the graph
+    torch_compile: bool = False
 
 class FinalKhmerASRTrainer:
     """Final trainer for mega Khmer dataset"""
@@ -78,19 +215,17 @@ class FinalKhmerASRTrainer:
         """Create vocabulary from mega dataset"""
         logger.info("Creating vocabulary from mega dataset...")
         
-        # Collect all transcriptions
-        all_text = []
-        for split in dataset_dict.values():
-            all_text.extend(split["transcription"])
+        # Collect all transcriptions into one lowercased string
+        all_text = ''.join(
+            text for split in dataset_dict.values() for text in split["transcription"] if text
+        ).lower()
         
-        # Extract unique characters
-        vocab_set = set()
-        for text in all_text:
-            if text:
-                vocab_set.update(text.lower())
+        # Extract unique characters: np.unique over UTF-32 code points, which
+        # also leaves them sorted
+        code_points = np.unique(np.frombuffer(all_text.encode('utf-32-le'), dtype=np.uint32))
         
         # Create vocabulary dictionary
-        vocab_dict = {v: k for k, v in enumerate(sorted(vocab_set))}
+        vocab_dict = {chr(code_point): k for k, code_point in enumerate(code_points.tolist())}
         
         # Add special tokens
         vocab_dict["[UNK]"] = len(vocab_dict)
@@ -126,94 +261,62 @@ class FinalKhmerASRTrainer:
                 logger.warning(f"Manifest not found: {manifest_path}")
                 continue
             
-            # Load manifest
-            data = []
-            with open(manifest_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    item = json.loads(line)
-                    if 'audio' in item and 'path' in item['audio']:
-                        # Fix audio path
-                        audio_path = item['audio']['path']
-                        if audio_path.startswith('audio/'):
-                            audio_path = audio_path[6:]
-                        full_audio_path = audio_dir / "audio" / audio_path
-                        
-                        data.append({
-                            'audio': str(full_audio_path),
-                            'transcription': item['transcription'],
-                            'duration': item['duration'],
-                            'speaker_id': item.get('speaker_id', 'unknown'),
-                            'source': item.get('source', 'unknown')
-                        })
-            
-            # Create dataset
-            dataset = Dataset.from_list(data)
-            dataset = dataset.cast_column('audio', Audio(sampling_rate=self.config.target_sampling_rate))
+            # Load manifest: parse its shards in parallel, written straight
+            # to Arrow; audio is decoded once later by precompute_waveforms
+            num_shards = os.cpu_count() or 1
+            shard_paths = convert_to_sharded_manifest(manifest_path, num_shards)
+            dataset = Dataset.from_generator(
+                iter_manifest_rows,
+                features=MANIFEST_FEATURES,
+                gen_kwargs={
+                    'shard_paths': [str(p) for p in shard_paths],
+                    'audio_dir': str(audio_dir),
+                    'manifest_version': manifest_path.stat().st_mtime_ns
+                },
+                num_proc=num_shards,
+                # Later map() calls write their cache files next to this one
+                cache_dir=self.config.cache_dir
+            )
             
             dataset_dict[split] = dataset
             logger.info(f"Loaded {len(dataset)} samples for {split}")
             
             # Log source distribution
-            sources = [item.get('source', 'unknown') for item in data]
-            source_counts = pd.Series(sources).value_counts()
+            source_counts = pd.Series(dataset['source']).value_counts()
             logger.info(f"{split} source distribution:")
             for source, count in source_counts.items():
                 logger.info(f"  {source}: {count} samples")
         
         return DatasetDict(dataset_dict)
     
-    def augment_audio(self, audio_array: np.ndarray) -> np.ndarray:
-        """Apply data augmentation"""
-        if not self.config.use_data_augmentation:
-            return audio_array
-        
-        # Speed perturbation
-        if np.random.random() < 0.3:
-            speed_factor = np.random.uniform(0.9, 1.1)
-            audio_array = librosa.effects.time_stretch(audio_array, rate=speed_factor)
-        
-        # Add background noise
-        if np.random.random() < 0.2:
-            noise_factor = np.random.uniform(0.001, 0.005)
-            noise = np.random.normal(0, noise_factor, audio_array.shape)
-            audio_array = audio_array + noise
-        
-        # Volume perturbation
-        if np.random.random() < 0.3:
-            volume_factor = np.random.uniform(0.8, 1.2)
-            audio_array = audio_array * volume_factor
-            
-        # Normalize and clip
-        audio_array = np.clip(audio_array, -1.0, 1.0)
-        
-        return audio_array
+    def add_speed_perturbed_copies(self, dataset: Dataset) -> Dataset:
+        """Append one copy of the dataset per speed perturbation rate"""
+        copies = [dataset]
+        for rate in self.config.speed_perturbation_rates:
+            copies.append(dataset.map(
+                lambda batch, rate=rate: {
+                    'npy_path': [f"{path[:-len('.npy')]}.sp{round(rate * 100):03d}.npy" for path in batch['npy_path']],
+                    'speed': [rate] * len(batch['speed']),
+                    'duration': [duration / rate for duration in batch['duration']]
+                },
+                batched=True
+            ))
+        logger.info(f"Added speed-perturbed copies at rates {self.config.speed_perturbation_rates}")
+        return concatenate_datasets(copies)
     
-    def preprocess_function(self, examples):
-        """Preprocess audio and text"""
-        # Process audio with augmentation
-        audio_arrays = []
-        for audio_data in examples["audio"]:
-            audio_array = audio_data["array"]
-            
-            # Apply augmentation during training
-            if self.config.use_data_augmentation:
-                audio_array = self.augment_audio(audio_array)
-            
-            audio_arrays.append(audio_array)
-        
-        inputs = self.processor(
-            audio_arrays, 
-            sampling_rate=self.config.target_sampling_rate,
-            return_tensors="pt",
-            padding=True
+    def precompute_waveforms(self, dataset_dict: DatasetDict) -> DatasetDict:
+        """Decode and resample every WAV once, caching it as float16 .npy"""
+        logger.info("Caching decoded waveforms as .npy (skipped for files already cached)...")
+        
+        return dataset_dict.map(
+            cache_waveforms,
+            input_columns=["audio_path", "npy_path", "speed"],
+            remove_columns=["audio_path"],
+            fn_kwargs={"target_sampling_rate": self.config.target_sampling_rate},
+            batched=True,
+            batch_size=100,
+            num_proc=os.cpu_count()
         )
-        
-        # Process text
-        with self.processor.as_target_processor():
-            labels = self.processor(examples["transcription"]).input_ids
-        
-        inputs["labels"] = labels
-        return inputs
     
     def setup_model_and_processor(self, tokenizer: Wav2Vec2CTCTokenizer):
         """Setup model for mega dataset training"""
@@ -244,7 +347,7 @@ class FinalKhmerASRTrainer:
             hidden_dropout=0.1,
             feat_proj_dropout=0.1,
             attention_dropout=0.1,
-            layerdrop=0.05  # Helps with large datasets
+            layerdrop=0.0 if self.config.torch_compile else 0.05  # Helps with large datasets
         )
         
         # Freeze feature encoder initially
@@ -263,14 +366,14 @@ class FinalKhmerASRTrainer:
         pred_str = self.processor.batch_decode(pred_ids)
         label_str = self.processor.batch_decode(pred.label_ids, group_tokens=False)
         
-        # Character error rate
-        total_chars = sum(len(label) for label in label_str)
-        total_errors = sum(
-            sum(c1 != c2 for c1, c2 in zip(pred, label))
-            for pred, label in zip(pred_str, label_str)
-        )
-        
-        cer = total_errors / total_chars if total_chars > 0 else 0.0
+        # Character error rate: edit distance (insertions, deletions and
+        # substitutions) over reference characters; jiwer rejects empty references
+        pairs = [(label, pred) for label, pred in zip(label_str, pred_str) if label]
+        if pairs:
+            references, predictions = zip(*pairs)
+            cer = jiwer_cer(list(references), list(predictions))
+        else:
+            cer = 0.0
         
         return {"cer": cer}
     
@@ -288,27 +391,52 @@ class FinalKhmerASRTrainer:
         # Setup model
         self.setup_model_and_processor(tokenizer)
         
+        # Speed perturbation is done once here rather than per sample in
+        # augment_audio; decode audio once, up front
+        if self.config.use_data_augmentation and self.config.speed_perturbation_rates:
+            dataset_dict["train"] = self.add_speed_perturbed_copies(dataset_dict["train"])
+        dataset_dict = self.precompute_waveforms(dataset_dict)
+        
         # Preprocess datasets
         logger.info("Preprocessing mega dataset (this may take a while)...")
         encoded_datasets = dataset_dict.map(
-            self.preprocess_function,
+            preprocess_function,
+            fn_kwargs={
+                "processor": self.processor,
+                "target_sampling_rate": self.config.target_sampling_rate,
+                "use_data_augmentation": self.config.use_data_augmentation
+            },
             remove_columns=dataset_dict["train"].column_names,
             batched=True,
-            batch_size=50,  # Smaller batch for memory efficiency
-            num_proc=1
+            batch_size=500,
+            num_proc=max(1, (os.cpu_count() or 1) // 2),
+            load_from_cache_file=True,
+            writer_batch_size=1000
         )
         
+        # Ampere/Hopper GPUs (compute capability 8+) train in native bf16 (no
+        # loss scaling) with TF32 matmuls; older GPUs such as T4/V100 keep fp16.
+        # is_bf16_supported() alone also counts emulated bf16 on those
+        bf16_supported = torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8
+        
         # Advanced training arguments for large dataset
         training_args = TrainingArguments(
             output_dir=self.config.output_dir,
             group_by_length=True,
+            length_column_name="input_length",
             per_device_train_batch_size=self.config.per_device_train_batch_size,
             per_device_eval_batch_size=self.config.per_device_eval_batch_size,
             gradient_accumulation_steps=self.config.gradient_accumulation_steps,
             evaluation_strategy="steps",
             num_train_epochs=self.config.num_train_epochs,
-            fp16=True,
+            bf16=bf16_supported,
+            fp16=not bf16_supported,
+            tf32=bf16_supported,
             gradient_checkpointing=True,
+            # Default mode rather than reduce-overhead: CUDA graphs would be
+            # re-captured for every new padded audio length
+            torch_compile=self.config.torch_compile,
+            torch_compile_mode="default",
             save_steps=self.config.save_steps,
             eval_steps=self.config.eval_steps,
             logging_steps=self.config.logging_steps,
@@ -45,6 +45,11 @@ class DataCollatorSpeechSeq2SeqWithPadding:
     def __call__(self, features):
         input_features = [{"input_features": feature["input_features"]} for feature in features]
         batch = self.processor.feature_extractor.pad(input_features, return_tensors="pt")
+        # float16 features (as written by preprocess_for_sagemaker) are cast up
+        # to match the fp32 weights; autocast still runs the model in fp16, and
+        # generate() in evaluation gets no autocast at all
+        if batch["input_features"].dtype == torch.float16:
+            batch["input_features"] = batch["input_features"].to(torch.float32)
 
         label_features = [{"input_ids": feature["labels"]} for feature in features]
         labels_batch = self.processor.tokenizer.pad(label_features, return_tensors="pt")
@@ -158,7 +163,8 @@ class KhmerWhisperTrainer:
         
         return {
             "input_features": input_features,
-            "labels": labels
+            "labels": labels,
+            "length": len(labels)
         }
     
     def compute_metrics(self, pred):
@@ -222,6 +228,9 @@ class KhmerWhisperTrainer:
             fp16=self.args.fp16,
             dataloader_num_workers=self.args.dataloader_num_workers,
             group_by_length=self.args.group_by_length,
+            # Precomputed label lengths: features are all 30s, so labels are
+            # what varies, and the sampler reads them instead of scanning
+            length_column_name="length",
             
             # Generation for evaluation
             predict_with_generate=self.args.predict_with_generate,